@@ -0,0 +1,62 @@
+import sys
+import argparse
+from contextlib import redirect_stdout
+from .bot import TANBot
+
+"""
+Command line interface of the TANBot.
+
+    python -m tanbot plan [--cached] [--diff] [--facebook] [--instagram] [--json]
+    python -m tanbot run  [--diff] [--broadcast] [--facebook]
+
+`plan` reports what a run would do without writing or sending anything.
+"""
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="tanbot", description="TAN-bot: A bot to fetch data from Google Sheets.")
+    parser.add_argument("--path", default="./", help="the root path of the website (default: ./)")
+    parser.add_argument("--source", default=None, help="the data source, e.g. csv:<path> (default: DATA_SOURCE or gsheet)")
+    parser.add_argument("--layout", default="flat", choices=["flat", "sharded"], help="the layout of the Hugo posts")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    plan_parser = subparsers.add_parser("plan", help="report what a run would do, without side effects")
+    plan_parser.add_argument("--cached", action="store_true", help="use the snapshot of the previous fetch instead of the sheet")
+    plan_parser.add_argument("--diff", action="store_true", help="plan a run on the snapshot diff")
+    plan_parser.add_argument("--no-line", action="store_true", help="do not plan the LINE broadcasts")
+    plan_parser.add_argument("--facebook", action="store_true", help="plan the Facebook page posts")
+    plan_parser.add_argument("--instagram", action="store_true", help="plan the Instagram posts")
+    plan_parser.add_argument("--json", action="store_true", help="print the plan as JSON")
+
+    run_parser = subparsers.add_parser("run", help="generate the Hugo posts")
+    run_parser.add_argument("--diff", action="store_true", help="only act on the snapshot diff")
+    run_parser.add_argument("--broadcast", action="store_true", help="broadcast the new posts to LINE")
+    run_parser.add_argument("--facebook", action="store_true", help="also publish the new posts to Facebook")
+
+    args = parser.parse_args(argv)
+    if args.command == "plan":
+        # with --json, stdout only carries the plan, the progress messages go to stderr
+        with redirect_stdout(sys.stderr if args.json else sys.stdout):
+            bot = TANBot(path=args.path, source=args.source, hugo_layout=args.layout)
+            plan = bot.plan(cached=args.cached, diff=args.diff, line=not args.no_line,
+                            facebook=args.facebook, instagram=args.instagram)
+        print(plan.to_json() if args.json else plan.report())
+        return 0
+
+    bot = TANBot(path=args.path, source=args.source, hugo_layout=args.layout)
+
+    bot.load_gsheet()
+    diff = bot.diff_gsheet() if args.diff else None
+    updated = bot.hugo.generate_posts(diff=diff)
+    if diff is not None:
+        # only advance the snapshot once the diff has been applied
+        bot.commit_snapshot()
+    if updated:
+        print("Posts updated successfully.")
+        if args.broadcast or args.facebook:
+            bot.broadcast(line=args.broadcast, facebook=args.facebook)
+    else:
+        print("No posts were updated.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
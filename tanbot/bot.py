@@ -2,9 +2,14 @@ from dotenv import load_dotenv
 import os
 import re
 import pandas as pd
+from .schema import SheetSchema, SheetSchemaError
+from .snapshot import SnapshotStore
+from .dedup import DuplicateIndex
+from .plan import make_plan
+from .sources import BaseSource, GoogleSheetSource, make_source
 from .handlers.hugo.hugoHandler import HugoHandler
 from .handlers.instagram.instagramHandler import InstagramHandler # WIP
-from .handlers.facebook.facebookHandler import FacebookHandler  # WIP
+from .handlers.facebook.facebookHandler import FacebookHandler
 from .handlers.base import BaseImageHandler # testing purposes
 from .handlers.line.linebotHandler import LinebotHandler
 
@@ -27,7 +32,13 @@ class TANBot:
     def __init__(self, path="./", 
                        rel_path_to_hugo="content/tan/tan-bot",
                        rel_path_to_line="linebot",
-                       rel_path_to_image="images"):
+                       rel_path_to_image="images",
+                       rel_path_to_snapshot=".tanbot",
+                       rel_path_to_search_index=None,
+                       hugo_layout="flat",
+                       csv_engine=None,
+                       source=None,
+                       dedup=None):
         
         self.name = "TAN-bot"
         self.description = "A bot to fetch data from Google Sheets."
@@ -37,12 +48,29 @@ class TANBot:
         self.hugo_post_path = os.path.join(self.path, rel_path_to_hugo)
         self.line_post_path = os.path.join(self.path, rel_path_to_line)
         self.image_path = os.path.join(self.path, rel_path_to_image)
+        self.snapshot_path = os.path.join(self.path, rel_path_to_snapshot)
+        self.search_index_path = None
+        if rel_path_to_search_index is not None:
+            self.search_index_path = os.path.join(self.path, rel_path_to_search_index)
+
+        # the declared sheet columns, and the CSV parser ("c" or "pyarrow")
+        self.schema = SheetSchema()
+        self.csv_engine = csv_engine
+        # the data source, a BaseSource or a spec string such as "csv:<path>" (see sources.py)
+        self.source = source
+        self.snapshot = SnapshotStore(self.snapshot_path)
+        # near-duplicate detection of re-sent announcements, "drop", "mark" or None (disabled)
+        self.dedup = None
+        if dedup is not None:
+            self.dedup = DuplicateIndex(os.path.join(self.snapshot_path, "dedup.json"), policy=dedup)
 
         # 
-        self.hugo = HugoHandler(self.hugo_post_path)
+        self.hugo = HugoHandler(self.hugo_post_path, layout=hugo_layout,
+                                search_index_dir=self.search_index_path,
+                                dedup=self.dedup)
         self.line = LinebotHandler(self.line_post_path)  # for testing purposes
         self.instagram = InstagramHandler(self.image_path)  # WIP, for future use
-        self.facebook = FacebookHandler(self.image_path)  # WIP, for future use
+        self.facebook = FacebookHandler(self.image_path)  # fan-page posts via Graph batch requests
         self.image = BaseImageHandler(self.image_path)  # for testing purposes
 
         # get the VERSION from __init_.py
@@ -59,26 +87,120 @@ class TANBot:
         load_dotenv()
         self.sheet_id = os.getenv("SHEET_ID")
         self.worksheet_gid = os.getenv("WORKSHEET_GID")
+        if self.csv_engine is None:
+            self.csv_engine = os.getenv("CSV_ENGINE", "c")
+        if self.source is None:
+            self.source = os.getenv("DATA_SOURCE", "gsheet")
+        if not isinstance(self.source, BaseSource):
+            self.source = make_source(self.source, self.sheet_id, self.worksheet_gid)
+        if isinstance(self.source, GoogleSheetSource):
+            self.csv_url = self.source.csv_url
 
-    def load_gsheet(self):
-        """Load Google Sheet data into a pandas DataFrame."""
+    def load_gsheet(self, delta=False):
+        """
+        Load the sheet data from the data source into a pandas DataFrame.
+        :param delta: Only fetch the rows from the newest timestamp of the snapshot on,
+                      and merge them into the snapshot rows in memory. Falls back to
+                      the full export when there is no snapshot or the delta query fails.
+                      The snapshot itself only advances with commit_snapshot(), so call
+                      it after each run, or every delta grows with the rows since the
+                      last commit.
+        """
         self._load_env()
-        sheet_id = self.sheet_id
-        worksheet_gid = self.worksheet_gid
-        if not sheet_id or not worksheet_gid:
-            raise ValueError("SHEET_ID and WORKSHEET_GID must be set in the environment variables.")
+        df = None
+        if delta:
+            df = self._load_delta()
+        if df is None:
+            try:
+                df = self.source.read(self.schema, engine=self.csv_engine)
+            except SheetSchemaError:
+                raise
+            except Exception as e:
+                raise RuntimeError(f"Failed to load Google Sheet data from {self.source}: {e}")
+        self._set_df(df)
+        print(f"Data loaded successfully.")
 
-        self.csv_url =f"https://docs.google.com/spreadsheets/d/{sheet_id}/export?format=csv&id={sheet_id}&gid={worksheet_gid}"
+    def _load_delta(self):
+        """
+        Fetch the rows from the newest timestamp of the cached history on and merge
+        them into it; the rows of that same second come back and are de-duplicated
+        on the key. The merged rows are not saved, see commit_snapshot().
+        Return None if the full export has to be loaded instead.
+        """
+        history = self.snapshot.load()
+        if history is None or len(history) == 0:
+            print("No cached history found, loading the full export.")
+            return None
+
+        history = self.schema.coerce(history, engine=self.csv_engine)
+        since = history[self.schema.timestamp_column].max()
         try:
-            self.df = pd.read_csv(self.csv_url)
-            self.hugo.df = self.df  # Set the DataFrame in the hugo handler
-            self.line.df = self.df  # Set the DataFrame in the LINE handler for testing purposes
-            self.instagram.df = self.df  # Set the DataFrame in the Instagram handler
-            self.facebook.df = self.df  # Set the DataFrame in the Facebook handler
-            self.image.df = self.df  # Set the DataFrame in the image handler for testing purposes
-            print(f"Data loaded successfully.")
+            new_rows = self.source.read_delta(self.schema, since, engine=self.csv_engine)
         except Exception as e:
-            raise RuntimeError(f"Failed to load Google Sheet data: {e}")
+            print(f"Delta query failed ({e}), loading the full export.")
+            return None
+
+        print(f"Delta query returned {len(new_rows)} rows since {since}.")
+        df = pd.concat([history, new_rows], ignore_index=True)
+        df = df.drop_duplicates(subset=self.snapshot.key, keep="last").reset_index(drop=True)
+        return df
+
+    def _set_df(self, df):
+        """Set the DataFrame in the bot and all handlers."""
+        self.df = df
+        self.hugo.df = self.df  # Set the DataFrame in the hugo handler
+        self.line.df = self.df  # Set the DataFrame in the LINE handler for testing purposes
+        self.instagram.df = self.df  # Set the DataFrame in the Instagram handler
+        self.facebook.df = self.df  # Set the DataFrame in the Facebook handler
+        self.image.df = self.df  # Set the DataFrame in the image handler for testing purposes
+
+    def diff_gsheet(self, save=False):
+        """
+        Compare the loaded sheet with the snapshot of the previous fetch.
+        :param save: Save the loaded sheet as the new snapshot right away.
+                     Prefer commit_snapshot() after the diff has been applied,
+                     so a failed run shows the same diff again next time.
+        :return: A SnapshotDiff with the added, changed and removed rows,
+                 which can be passed to HugoHandler.generate_posts(diff=...).
+        """
+        if getattr(self, "df", None) is None:
+            raise ValueError("DataFrame is not loaded. Please call load_gsheet() first.")
+        diff = self.snapshot.diff(self.df)
+        if save:
+            self.commit_snapshot()
+        return diff
+
+    def commit_snapshot(self):
+        """
+        Save the loaded sheet as the new snapshot.
+        Call it once the handlers have applied the diff.
+        """
+        if getattr(self, "df", None) is None:
+            raise ValueError("DataFrame is not loaded. Please call load_gsheet() first.")
+        self.snapshot.save(self.df)
+
+    def plan(self, cached=False, diff=False, line=True, instagram=False, facebook=False):
+        """
+        Compute what a run would do, without writing or sending anything.
+        :param cached: Use the snapshot of the previous fetch instead of fetching the sheet.
+        :param diff: Plan a run on the snapshot diff (generate_posts(diff=...)),
+                     instead of a run on the posts newer than the latest post.
+        :param line, instagram, facebook: The channels to plan, as in broadcast().
+        :return: A RunPlan with a ChannelPlan per channel.
+        """
+        if cached:
+            df = self.snapshot.load()
+            if df is None:
+                raise ValueError(f"No cached sheet data found in {self.snapshot.snapshot_dir}.")
+            load_dotenv()
+            engine = self.csv_engine or os.getenv("CSV_ENGINE", "c")
+            self._set_df(self.schema.coerce(df, engine=engine))
+            source = f"cache ({self.snapshot.path})"
+        else:
+            self.load_gsheet()
+            source = str(self.source)
+        snapshot_diff = self.snapshot.diff(self.df) if diff else None
+        return make_plan(self, source, diff=snapshot_diff, line=line, facebook=facebook, instagram=instagram)
 
     def broadcast(self, line=True, instagram=False, facebook=False):
         """
@@ -92,8 +214,10 @@ class TANBot:
             # Note: Instagram broadcasting is not allowed by Instagram's API.
             raise NotImplementedError("Instagram broadcasting is not implemented yet.")
         if facebook:
-            # Note: Facebook fan-page auto post is not implmented yet.
-            raise NotImplementedError("Facebook broadcasting is not implemented yet.")
+            # fail before anything is sent, instead of after a partial broadcast
+            self.facebook.validate_credentials()
+            # the new posts are published in Graph API batch requests
+            self.facebook.publish_hugo_posts(new_posts)
         if line:
             for post in new_posts:
                 # WIP: Implement the LINE broadcasting logic here
@@ -0,0 +1,153 @@
+import os
+import re
+import json
+import hashlib
+from collections import Counter
+from .handlers.hugo.searchIndex import tokenize
+
+"""
+Near-duplicate detection of TAN announcements.
+
+Reminders, corrections and cross-posts of an announcement arrive with a new
+Message ID, but nearly the same subject and body. Every post is fingerprinted
+with a 64-bit SimHash of its cleaned subject and body; two posts are
+near-duplicates when their fingerprints differ in at most `max_distance` bits.
+
+The fingerprints are split into `bands` bands of 64/bands bits. Two
+fingerprints within `max_distance < bands` bits share at least one band
+exactly, so a new post is only compared with the posts in its band buckets
+(locality-sensitive hashing) instead of with the whole archive.
+"""
+
+# prefixes of re-sent announcements, removed before fingerprinting
+RESEND_PATTERN = re.compile(
+    r'^\s*((re|fw|fwd|reminder|update|updated|correction|repost)\s*[:：]|'
+    r'\[(reminder|update|updated|correction|repost)\]|'
+    r'(提醒|更正|再次提醒|轉寄)\s*[:：]?)\s*',
+    re.IGNORECASE)
+
+def clean_resend_subject(subject):
+    """
+    Remove the reminder/forward/correction prefixes of a subject.
+    """
+    previous = None
+    while subject and subject != previous:
+        previous = subject
+        subject = RESEND_PATTERN.sub('', subject, count=1)
+    return subject
+
+def simhash(tokens, bits=64):
+    """
+    Return the SimHash fingerprint of a list of tokens, weighted by their counts.
+    """
+    weights = [0] * bits
+    for token, count in Counter(tokens).items():
+        h = int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=bits // 8).digest(), 'big')
+        for i in range(bits):
+            weights[i] += count if (h >> i) & 1 else -count
+    fingerprint = 0
+    for i in range(bits):
+        if weights[i] > 0:
+            fingerprint |= 1 << i
+    return fingerprint
+
+class DuplicateIndex:
+    def __init__(self, path, policy="drop", max_distance=3, bands=4):
+        """
+        :param path: The JSON file that keeps the fingerprints between runs.
+        :param policy: What to do with a near-duplicate post:
+                       "drop" does not write nor broadcast it,
+                       "mark" writes it with a duplicate_of front matter, but does not broadcast it.
+        :param max_distance: The maximal Hamming distance of near-duplicates.
+        :param bands: The number of LSH bands, must be larger than max_distance.
+        """
+        if policy not in ("drop", "mark"):
+            raise ValueError(f"Unsupported duplicate policy: {policy}. Use 'drop' or 'mark'.")
+        if bands <= max_distance or 64 % bands != 0:
+            raise ValueError("bands must divide 64 and be larger than max_distance.")
+        self.path = path
+        self.policy = policy
+        self.max_distance = max_distance
+        self.bands = bands
+        self.band_bits = 64 // bands
+        self._fingerprints = {}   # post id -> fingerprint
+        self._buckets = {}        # (band, band value) -> post ids
+        self.load()
+        return
+
+    def __len__(self):
+        return len(self._fingerprints)
+
+    def fingerprint(self, post):
+        """
+        Return the SimHash of the cleaned subject and body of a post.
+        """
+        text = f"{clean_resend_subject(post.title)}\n{post.content}"
+        return simhash(tokenize(text))
+
+    def _band_keys(self, fingerprint):
+        mask = (1 << self.band_bits) - 1
+        return [(band, (fingerprint >> (band * self.band_bits)) & mask) for band in range(self.bands)]
+
+    def find(self, post):
+        """
+        Return the id of a near-duplicate of the post in the index, or None.
+        The post itself (same id) is not a duplicate.
+        """
+        fingerprint = self.fingerprint(post)
+        best = None
+        for key in self._band_keys(fingerprint):
+            for doc_id in self._buckets.get(key, ()):
+                if doc_id == post.filename_head:
+                    continue
+                distance = bin(fingerprint ^ self._fingerprints[doc_id]).count('1')
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (doc_id, distance)
+        return None if best is None else best[0]
+
+    def add(self, post):
+        """
+        Add a post to the index.
+        """
+        doc_id = post.filename_head
+        if doc_id in self._fingerprints:
+            return
+        fingerprint = self.fingerprint(post)
+        self._fingerprints[doc_id] = fingerprint
+        for key in self._band_keys(fingerprint):
+            self._buckets.setdefault(key, []).append(doc_id)
+        return
+
+    def load(self):
+        """
+        Load the fingerprints and rebuild the band buckets.
+        """
+        self._fingerprints = {}
+        self._buckets = {}
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for doc_id, fingerprint in data.get("fingerprints", {}).items():
+            fingerprint = int(fingerprint, 16)
+            self._fingerprints[doc_id] = fingerprint
+            for key in self._band_keys(fingerprint):
+                self._buckets.setdefault(key, []).append(doc_id)
+        return
+
+    def save(self):
+        """
+        Save the fingerprints.
+        """
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        data = {
+            "bits": 64,
+            "fingerprints": {k: f"{v:016x}" for k, v in sorted(self._fingerprints.items())},
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=0)
+        os.replace(tmp_path, self.path)
+        return
@@ -2,6 +2,6 @@ from .base import BaseHandler, BaseImageHandler
 from .hugo.hugoHandler import HugoHandler
 from .line.linebotHandler import LinebotHandler  # WIP
 from .instagram.instagramHandler import InstagramHandler
-from .facebook.facebookHandler import FacebookHandler  # WIP
+from .facebook.facebookHandler import FacebookHandler
 
 __all__ = ['BaseHandler', 'BaseImageHandler', 'HugoHandler', 'LinebotHandler', 'InstagramHandler', 'FacebookHandler']
\ No newline at end of file
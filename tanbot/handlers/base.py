@@ -77,8 +77,12 @@ class BaseHandler:
         content = self._clean_content(row['Full Body'])
         msg_id = row['Message ID']
 
-        # Convert the str time to a time object
-        timestamp = time.strptime(timestamp, self.timestamp_format)
+        # Convert the time to a time object,
+        # the timestamp is already parsed to datetime by the sheet schema
+        if isinstance(timestamp, str):
+            timestamp = time.strptime(timestamp, self.timestamp_format)
+        else:
+            timestamp = timestamp.timetuple()
         date = time.strftime(self.date_format, timestamp)
         
         # Create the filename
@@ -1,10 +1,253 @@
+import os
+import time
+import json
+from dataclasses import dataclass
+from urllib.parse import urlencode
 from ..base import BaseImageHandler
+from ..base import ImagePost
+from ..hugo.hugoHandler import HugoPost
+from dotenv import load_dotenv
+import requests
+from urllib3.exceptions import NewConnectionError
+
+class BatchThrottledError(ValueError):
+    """
+    Raised when the Graph API rejects a whole batch request by throttling,
+    so none of its operations was executed.
+    """
+
+@dataclass
+class FacebookPost(ImagePost):
+    """
+    Data class for Facebook page posts.
+    """
+    caption: str = ''
 
 class FacebookHandler(BaseImageHandler):
     """
     Handler for Facebook posts.
     Inherits from BaseImageHandler.
+
+    New posts are published to the fan page as photos through Graph API batch
+    requests: up to `batch_size` photo uploads share one HTTP call, and the
+    rendered images are sent as multipart attachments of the batch.
+
+    Publishing a photo cannot be undone, so an operation is only sent again when
+    it was certainly not executed: a batch that never reached the server
+    (connection errors), a batch or an operation rejected by throttling. Those are
+    retried in a new request with the remaining operations of the same batch.
+    Timeouts and server errors are reported as failed and never resent, as the
+    photo may already be on the page.
     """
 
-    def __init__(self, bot):
-        super().__init__(bot)
+    def __init__(self, post_dir, page_id=None, access_token=None,
+                 graph_url="https://graph.facebook.com", api_version="v19.0",
+                 batch_size=50, max_retries=3, retry_delay=2.0, timeout=120):
+        """
+        :param post_dir: The directory to save the rendered images.
+        :param page_id: The fan page id, defaults to FB_PAGE_ID in the environment.
+        :param access_token: The page access token, defaults to FB_PAGE_TOKEN in the environment.
+        :param graph_url: The Graph API url, can be replaced by a local server in tests.
+        :param batch_size: The number of operations per batch request (50 at most).
+        :param max_retries: The number of retries of a failed operation.
+        :param retry_delay: The initial delay between retries in seconds, doubled after each retry.
+        :param timeout: The timeout of a batch request in seconds.
+        """
+        super().__init__(post_dir)
+        if not 0 < batch_size <= 50:
+            raise ValueError("batch_size must be between 1 and 50.")
+        self.page_id = page_id
+        self.access_token = access_token
+        self.graph_url = graph_url.rstrip('/')
+        self.api_version = api_version
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+
+    def validate_credentials(self):
+        """
+        Check that the page id and token are set, before publishing anything.
+        """
+        self._load_env()
+
+    def _load_env(self):
+        """Load the page id and token from .env file if they are not given."""
+        load_dotenv()
+        if self.page_id is None:
+            self.page_id = os.getenv("FB_PAGE_ID")
+        if self.access_token is None:
+            self.access_token = os.getenv("FB_PAGE_TOKEN")
+        if not self.page_id or not self.access_token:
+            raise ValueError("FB_PAGE_ID and FB_PAGE_TOKEN must be set in the environment variables.")
+
+    def get_facebook_post_from_hugo_post(self, hugo_post: HugoPost):
+        """
+        Convert a HugoPost to a FacebookPost, linking to the post on the website.
+        """
+        baseUrl = "https://asroc-taiwan.github.io/website/en/tan/tan-bot/"
+        post_url = f"{baseUrl}{hugo_post.filename_head}/"
+        if hugo_post.subdir:
+            post_url = f"{baseUrl}{hugo_post.subdir}/{hugo_post.filename_head}/"
+
+        post = FacebookPost(
+            title=hugo_post.title,
+            date=hugo_post.date,
+            author=hugo_post.author,
+            summary=hugo_post.summary,
+            content=hugo_post.content,
+            filename_head=hugo_post.filename_head,
+            filename=f"{hugo_post.filename_head}.png",
+            base_image=self.base_image,
+            caption=f"{hugo_post.title}\n\n{post_url}",
+            draft=hugo_post.draft
+        )
+        return post
+
+    def publish_hugo_posts(self, hugo_posts):
+        """
+        Render and publish Hugo posts to the fan page.
+        :return: A dict of filename to the Graph response body, or to the error.
+        """
+        posts = [self.get_facebook_post_from_hugo_post(p) for p in hugo_posts]
+        for post in posts:
+            self.write_image_post(post)
+        return self.publish_posts(posts)
+
+    def publish_posts(self, posts):
+        """
+        Publish rendered posts to the fan page in batch requests.
+        :return: A dict of filename to the Graph response body, or to the error.
+        """
+        self._load_env()
+        posts = [p for p in posts if not p.draft]
+        results = {}
+        for i in range(0, len(posts), self.batch_size):
+            results.update(self._publish_batch(posts[i:i + self.batch_size]))
+        failed = [k for k, v in results.items() if "error" in v]
+        print(f"Published {len(results) - len(failed)} posts to Facebook, {len(failed)} failed.")
+        return results
+
+    def _publish_batch(self, posts):
+        """
+        Publish up to batch_size posts, retrying the operations that were not executed.
+        """
+        results = {}
+        pending = list(posts)
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                delay = self.retry_delay * 2 ** (attempt - 1)
+                print(f"Retrying {len(pending)} Facebook operations in {delay} seconds...")
+                time.sleep(delay)
+
+            try:
+                responses = self._send_batch(pending)
+            except (requests.RequestException, ValueError) as e:
+                print(f"Facebook batch request failed: {e}")
+                for post in pending:
+                    results[post.filename] = {"error": str(e)}
+                if self._never_sent(e):
+                    continue
+                # the batch may have been (partly) executed, do not resend it
+                break
+
+            retry = []
+            for post, response in zip(pending, responses):
+                status, body = self._parse_response(response)
+                if 200 <= status < 300:
+                    results[post.filename] = body
+                    print(f"Post {post.filename} published to Facebook: {body}")
+                else:
+                    results[post.filename] = {"error": body, "status": status}
+                    if self._is_transient(status, body):
+                        retry.append(post)
+                    else:
+                        print(f"Post {post.filename} failed: {status}-{body}")
+            pending = retry
+            if len(pending) == 0:
+                break
+        return results
+
+    def _send_batch(self, posts):
+        """
+        Send one Graph API batch request with the images attached.
+        :return: The list of per-operation responses.
+        """
+        operations = []
+        files = {}
+        handles = []
+        try:
+            for index, post in enumerate(posts):
+                name = f"file{index}"
+                operations.append({
+                    "method": "POST",
+                    "relative_url": f"{self.page_id}/photos",
+                    "attached_files": name,
+                    "body": urlencode({"message": post.caption}),
+                })
+                f = open(os.path.join(self.image_dir, post.filename), 'rb')
+                handles.append(f)
+                files[name] = (post.filename, f, "image/png")
+
+            data = {
+                "access_token": self.access_token,
+                "batch": json.dumps(operations),
+            }
+            url = f"{self.graph_url}/{self.api_version}/"
+            res = requests.post(url, data=data, files=files, timeout=self.timeout)
+        finally:
+            for f in handles:
+                f.close()
+
+        if res.status_code != 200:
+            try:
+                error = res.json().get("error", {})
+            except ValueError:
+                error = {}
+            if self._is_transient(res.status_code, error):
+                raise BatchThrottledError(f"{res.status_code}-{res.text}")
+            raise ValueError(f"{res.status_code}-{res.text}")
+        responses = res.json()
+        if not isinstance(responses, list) or len(responses) != len(posts):
+            raise ValueError(f"Unexpected batch response: {res.text}")
+        return responses
+
+    def _parse_response(self, response):
+        """
+        Return the status code and the decoded body of a batch operation.
+        A null response means the operation timed out.
+        """
+        if response is None:
+            return 504, {"message": "operation timed out"}
+        status = response.get("code", 500)
+        try:
+            body = json.loads(response.get("body") or "{}")
+        except ValueError:
+            body = {"message": response.get("body")}
+        if "error" in body:
+            body = body["error"]
+        return status, body
+
+    def _never_sent(self, error):
+        """
+        Return True if a failed batch request was certainly not executed:
+        the connection could not be established, or the batch was throttled.
+        """
+        if isinstance(error, (requests.ConnectTimeout, BatchThrottledError)):
+            return True
+        if not isinstance(error, requests.ConnectionError) or isinstance(error, requests.Timeout):
+            return False
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+
+    def _is_transient(self, status, body):
+        """
+        Return True if a failed operation was rejected without being executed,
+        so it is safe to send it again: throttling and the Graph API rate-limit codes.
+        Server errors (5xx) and timeouts are not retried, the photo may have been published.
+        """
+        if status >= 500:
+            return False
+        if status == 429:
+            return True
+        return body.get("code") in (4, 17, 32, 341, 613)
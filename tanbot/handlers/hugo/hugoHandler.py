@@ -1,22 +1,84 @@
 import os
+import re
+import copy
 import time
 import glob
+import shutil
 import pandas as pd
-from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
 from ..base import Post, BaseHandler
+from .searchIndex import SearchIndex
 
 @dataclass
 class HugoPost(Post):
     filename: str = '2025_01_01_00_00_00-00000.zh-Hant.md'  # default filename, will be overwritten
+    subdir: str = ''  # the shard directory relative to post_dir, formatted as YYYY/MM ('' for the flat layout)
+    duplicate_of: str = ''  # the filename_head of the post this one is a near-duplicate of
+
+@dataclass
+class PostSelection:
+    create: list = field(default_factory=list)      # posts to write for the first time
+    update: list = field(default_factory=list)      # existing posts to overwrite
+    remove: list = field(default_factory=list)      # posts of removed rows to delete
+    skip: list = field(default_factory=list)        # posts that are up to date
+    replaced: list = field(default_factory=list)    # old posts of changed rows that moved to a new filename
+    duplicates: list = field(default_factory=list)  # near-duplicates among the posts to create (plan only)
+    full_rebuild: bool = False                      # no post was found in the directory
+
+@dataclass
+class RebuildSummary:
+    chunks: int          # the number of monthly chunks
+    written: int         # the number of posts written
+    workers: int         # the number of worker processes
+    elapsed: float       # the wall time of the rebuild in seconds
+    per_chunk: dict = field(default_factory=dict)  # the number of posts written per chunk (YYYY-MM)
+
+def _rebuild_chunk(post_dir, layout, section_url, chunk):
+    """
+    Prepare and write the posts of one chunk of rows, in a worker process.
+    :return: The (row position, post) pairs of the written posts.
+    """
+    handler = HugoHandler(post_dir, layout=layout, section_url=section_url)
+    written = []
+    for position, row in chunk.iterrows():
+        post = handler.prepare_a_post(row)
+        handler.write_post(post)
+        written.append((position, post))
+    return written
   
 class HugoHandler(BaseHandler):
-    def __init__(self, post_dir):
+    def __init__(self, post_dir, layout="flat", search_index_dir=None, dedup=None,
+                 section_url="/tan/tan-bot/"):
         """
         Initialize the HugoHandler with the directory to save posts.
         :param post_dir: The directory where the posts will be saved.
+        :param layout: "flat" saves all posts in post_dir,
+                       "sharded" saves them in post_dir/YYYY/MM/ with an _index.md per shard.
+        :param search_index_dir: Optional directory of the client-side search index,
+                                 updated with the posts written by generate_posts.
+                                 If there is no index yet, all published posts are indexed.
+        :param dedup: Optional DuplicateIndex. New posts that are near-duplicates of
+                      earlier posts are dropped or marked, and never become new posts.
+        :param section_url: The url of post_dir on the website. Posts of the sharded layout
+                            keep their flat url (section_url + filename_head) as an alias,
+                            so the links sent before the migration still resolve.
         """
+        if layout not in ("flat", "sharded"):
+            raise ValueError(f"Unsupported layout: {layout}. Use 'flat' or 'sharded'.")
         super().__init__(post_dir)
+        self.layout = layout
+        self.section_url = section_url
         self._new_post = []
+        self._updated_post = []
+        self._removed_post = []
+        self._duplicate_post = []
+        self._replaced_post = []
+        self.dedup = dedup
+        self.rebuild_summary = None
+        self.search_index = None
+        if search_index_dir is not None:
+            self.search_index = SearchIndex(search_index_dir)
         return
     
     @property
@@ -26,62 +88,493 @@ class HugoHandler(BaseHandler):
         """
         return self._new_post
 
-    def generate_posts(self):
-        df = self.df
+    @property
+    def updated_posts(self):
+        """
+        Return the existing posts that have been regenerated from changed rows.
+        """
+        return self._updated_post
+
+    @property
+    def removed_posts(self):
+        """
+        Return the posts that have been removed because their rows were deleted.
+        """
+        return self._removed_post
+
+    @property
+    def duplicate_posts(self):
+        """
+        Return the posts that have been dropped or marked as near-duplicates.
+        """
+        return self._duplicate_post
+
+    def generate_posts(self, diff=None, parallel=False, max_workers=None):
+        """
+        Generate the posts newer than the latest post in the directory.
+        :param diff: Optional SnapshotDiff. If given, only the added and changed
+                     rows are (re)generated and the posts of removed rows are deleted.
+        :param parallel: Run a full rebuild (no post in the directory) in a process pool.
+        :param max_workers: The number of worker processes, defaults to the number of CPUs.
+        """
+        n_new, n_updated, n_removed = len(self._new_post), len(self._updated_post), len(self._removed_post)
+        n_replaced = len(self._replaced_post)
+        has_updated = self._generate_posts(diff=diff, parallel=parallel, max_workers=max_workers)
+
+        if self.search_index is not None and not self.search_index.exists():
+            # the first run with an index also indexes the archive
+            self.search_index.build(self.published_posts())
+        elif self.search_index is not None and has_updated:
+            # merge only the posts written by this run into the search index
+            self.search_index.update(new_posts=self._new_post[n_new:],
+                                     updated_posts=self._updated_post[n_updated:],
+                                     removed_posts=self._removed_post[n_removed:] + self._replaced_post[n_replaced:])
+        if self.dedup is not None:
+            self.dedup.save()
+        return has_updated
+
+    def _generate_posts(self, diff=None, parallel=False, max_workers=None):
+        if parallel and diff is None and self.dedup is None:
+            # hand a full rebuild to the workers before preparing any row here
+            self._check_layout()
+            if self.latest_post_file() is None:
+                print("No posts found in the directory. Generate all posts from the data.")
+                return self.rebuild_posts(max_workers=max_workers)
 
-        all_posts = glob.glob(os.path.join(self.post_dir, '*.zh-Hant.md'))
-        last_post = None
-        if len(all_posts) == 0:
+        selection = self.select_posts(diff=diff)
+        if selection.full_rebuild:
             print("No posts found in the directory. Generate all posts from the data.")
+            if parallel and self.dedup is not None:
+                # the duplicates depend on the order of the rows
+                print("Duplicate detection is enabled, rebuilding serially.")
+
+        has_updated = False
+        for post in selection.skip:
+            print(f"Skipping post {post.filename} as it is up to date.")
+            if self.dedup is not None:
+                # published posts are the originals of later duplicates
+                self.dedup.add(post)
+
+        for post in selection.create:
+            if self.handle_duplicate(post):
+                # only a marked duplicate is written
+                has_updated = has_updated or bool(post.duplicate_of)
+                continue
+            self.write_post(post)
+            self._new_post.append(post)
+            has_updated = True
+
+        for post in selection.replaced:
+            # the old file of a post that moved to a new filename
+            if self.remove_post(post):
+                self._replaced_post.append(post)
+
+        for post in selection.update:
+            self.write_post(post)
+            self._updated_post.append(post)
+            has_updated = True
+
+        for post in selection.remove:
+            if self.remove_post(post):
+                self._removed_post.append(post)
+                has_updated = True
+        return has_updated
+
+    def published_posts(self):
+        """
+        Return the posts read back from the files in the directory, in filename order.
+        """
+        pattern = '*.zh-Hant.md' if self.layout == "flat" else os.path.join('[0-9]' * 4, '[0-9]' * 2, '*.zh-Hant.md')
+        posts = []
+        for filepath in sorted(glob.glob(os.path.join(self.post_dir, pattern))):
+            text = self.read_post(filepath)
+            end = text.index("---\n", 4)
+            front_matter = dict(line.split(": ", 1) for line in text[4:end].splitlines() if ": " in line)
+            filename = os.path.basename(filepath)
+            posts.append(HugoPost(
+                title=front_matter.get("title", '""')[1:-1],
+                date=front_matter.get("date", "").replace("+08:00", ""),
+                author='',
+                summary='',
+                content=text[end + len("---\n\n"):],
+                filename_head=filename[:-len('.zh-Hant.md')],
+                filename=filename,
+                subdir=self.shard_of(filename),
+                draft=front_matter.get("draft") == "true",
+            ))
+        return posts
+
+    def select_posts(self, diff=None):
+        """
+        Select the posts to create, update, remove or skip, without writing anything.
+        Without a diff, the posts newer than the latest post in the directory are created.
+        With a SnapshotDiff, added rows are created, changed rows are updated,
+        and the posts of removed rows are removed.
+        :return: A PostSelection.
+        """
+        self._check_layout()
+        if diff is not None:
+            return self._select_diff(diff)
+
+        selection = PostSelection()
+        last_post = self.latest_post_file()
+        if last_post is None:
+            selection.full_rebuild = True
         else:
-            # search the lastest post from the file name
-            # file name format: YYYY-MM-DDTHH:MM:SS-message_id.md
-            all_posts.sort(reverse=True)
-            last_post = all_posts[0] # is the latest post filename
             print(f"Latest post found: {last_post}")
             # find the datatime of the latest post from the filename
-            last_datetime = last_post.split('/')[-1].split('-')[0:1]
+            last_datetime = os.path.basename(last_post).split('-')[0:1]
             last_datetime = '-'.join(last_datetime)
             last_datetime = time.strptime(last_datetime, self.filedate_format)
 
         # iterate through the DataFrame to find the latest post
-        has_updated = False
-        for index, row in df.iterrows():
+        for index, row in self.df.iterrows():
             post = self.prepare_a_post(row)
             
             if last_post is not None:
                 # if the post date is earlier than the last post, skip it
                 post_date = time.strptime(post.date, self.date_format)
                 if post_date <= last_datetime:
-                    print(f"Skipping post {post.filename} as it is older than the last post.")
+                    selection.skip.append(post)
                     continue
+            selection.create.append(post)
+        return selection
+
+    def _select_diff(self, diff):
+        """
+        Select the posts of the rows that changed since the previous snapshot.
+        """
+        selection = PostSelection()
+
+        for _, row in diff.added.iterrows():
+            post = self.prepare_a_post(row)
+            filepath = self.post_path(post)
+            if not os.path.exists(filepath):
+                selection.create.append(post)
+            # the post was already generated before the first snapshot
+            elif self.read_post(filepath) == self.render_post(post):
+                selection.skip.append(post)
+            else:
+                selection.update.append(post)
+
+        for (_, row), (_, old_row) in zip(diff.changed.iterrows(), diff.changed_from.iterrows()):
+            post = self.prepare_a_post(row)
+            old_post = self.prepare_a_post(old_row)
+            # a corrected timestamp moves the post to a new filename
+            if old_post.filename != post.filename:
+                selection.replaced.append(old_post)
+            selection.update.append(post)
+
+        for _, row in diff.removed.iterrows():
+            selection.remove.append(self.prepare_a_post(row))
+        return selection
+
+    def plan_posts(self, diff=None):
+        """
+        Select the posts like generate_posts, and also separate the near-duplicates,
+        on a copy of the duplicate index. Nothing is written.
+        :return: A PostSelection.
+        """
+        selection = self.select_posts(diff=diff)
+        if self.dedup is None:
+            return selection
+
+        dedup = copy.deepcopy(self.dedup)
+        for post in selection.skip:
+            dedup.add(post)
+        create = []
+        for post in selection.create:
+            original = dedup.find(post)
+            if original is None:
+                dedup.add(post)
+                create.append(post)
+            else:
+                post.duplicate_of = original
+                selection.duplicates.append(post)
+        selection.create = create
+        return selection
+
+    def find_duplicate(self, post):
+        """
+        Return the filename_head of an earlier near-duplicate of the post, or None.
+        """
+        if self.dedup is None:
+            return None
+        return self.dedup.find(post)
+
+    def handle_duplicate(self, post):
+        """
+        Check a new post against the duplicate index.
+        A near-duplicate is dropped, or written with a duplicate_of mark, but it
+        never becomes a new post (so it is not broadcast).
+        :return: True if the post was a near-duplicate.
+        """
+        original = self.find_duplicate(post)
+        if original is None:
+            if self.dedup is not None:
+                self.dedup.add(post)
+            return False
+
+        self._duplicate_post.append(post)
+        if self.dedup.policy == "drop":
+            print(f"Post {post.filename} is a near-duplicate of {original}, dropped.")
+        else:
+            post.duplicate_of = original
             self.write_post(post)
-            self._new_post.append(post)
-            has_updated = True
-        return has_updated
+            print(f"Post {post.filename} is a near-duplicate of {original}, marked.")
+        return True
+
+    def rebuild_posts(self, max_workers=None):
+        """
+        Generate all posts from the data in a process pool.
+        The rows are partitioned into monthly chunks, each chunk is prepared and
+        written by one worker. The filenames do not depend on the worker, and the
+        new posts are collected in the order of the rows.
+        :return: True if any post was written. The summary is kept in self.rebuild_summary.
+        """
+        start = time.time()
+        df = self.df.reset_index(drop=True)
+        if len(df) == 0:
+            return False
+
+        timestamps = df['Timestamp']
+        if not pd.api.types.is_datetime64_any_dtype(timestamps):
+            timestamps = pd.to_datetime(timestamps, format=self.timestamp_format)
+        months = timestamps.dt.strftime('%Y-%m')
+        chunks = [(month, chunk) for month, chunk in df.groupby(months.values, sort=True)]
+
+        # create the directory once, instead of racing in the workers
+        os.makedirs(self.post_dir, exist_ok=True)
+
+        workers = min(max_workers or os.cpu_count() or 1, len(chunks))
+        written = []
+        per_chunk = {}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [(month, executor.submit(_rebuild_chunk, self.post_dir, self.layout,
+                                                    self.section_url, chunk))
+                       for month, chunk in chunks]
+            for month, future in futures:
+                result = future.result()
+                per_chunk[month] = len(result)
+                written.extend(result)
+
+        written.sort(key=lambda item: item[0])
+        self._new_post.extend(post for _, post in written)
+        self.rebuild_summary = RebuildSummary(
+            chunks=len(chunks),
+            written=len(written),
+            workers=workers,
+            elapsed=time.time() - start,
+            per_chunk=per_chunk,
+        )
+        print(f"Rebuilt {len(written)} posts in {len(chunks)} chunks "
+              f"with {workers} workers in {self.rebuild_summary.elapsed:.2f} s.")
+        return len(written) > 0
+
+    def apply_diff(self, diff):
+        """
+        Act on the rows that changed since the previous snapshot.
+        Added rows become new posts, changed rows overwrite their posts,
+        and the posts of removed rows are deleted.
+        """
+        return self.generate_posts(diff=diff)
+
+    def latest_post_file(self):
+        """
+        Return the path of the latest post, or None if there is no post.
+        In the sharded layout only the newest non-empty shard is searched.
+        """
+        # file name format: YYYY_MM_DD_HH_MM_SS-message_id.zh-Hant.md,
+        # so the latest post is the last one in the sorted file names
+        if self.layout == "flat":
+            all_posts = glob.glob(os.path.join(self.post_dir, '*.zh-Hant.md'))
+            if len(all_posts) == 0:
+                return None
+            return max(all_posts)
+
+        for year in self._list_shards(self.post_dir, r'\d{4}'):
+            year_dir = os.path.join(self.post_dir, year)
+            for month in self._list_shards(year_dir, r'\d{2}'):
+                all_posts = glob.glob(os.path.join(year_dir, month, '*.zh-Hant.md'))
+                if len(all_posts) > 0:
+                    return max(all_posts)
+        return None
+
+    def _check_layout(self):
+        """
+        Refuse to run the sharded layout on a directory that still holds flat posts:
+        they would not be found, and the whole archive would be generated (and
+        broadcast) again.
+        """
+        if self.layout != "sharded":
+            return
+        flat_posts = glob.glob(os.path.join(self.post_dir, '*.zh-Hant.md'))
+        if len(flat_posts) > 0:
+            raise RuntimeError(f"{len(flat_posts)} posts of the flat layout found in {self.post_dir}. "
+                               f"Call migrate_to_sharded() before using the sharded layout.")
+        return
+
+    def _list_shards(self, directory, pattern):
+        """
+        Return the shard directory names in a directory, newest first.
+        """
+        if not os.path.isdir(directory):
+            return []
+        names = [name for name in os.listdir(directory)
+                 if re.fullmatch(pattern, name) and os.path.isdir(os.path.join(directory, name))]
+        return sorted(names, reverse=True)
+
+    def shard_of(self, filename_head):
+        """
+        Return the shard directory (YYYY/MM) of a post in the sharded layout.
+        """
+        if self.layout == "flat":
+            return ''
+        return f"{filename_head[0:4]}/{filename_head[5:7]}"
+
+    def post_path(self, post):
+        """
+        Return the file path of a post.
+        """
+        return os.path.join(self.post_dir, post.subdir, post.filename)
+
+    def _ensure_shard_index(self, subdir):
+        """
+        Create the _index.md of the year and month shards of a post if they are missing.
+        """
+        year, month = subdir.split('/')
+        for rel_dir, title in ((year, year), (subdir, f"{year}-{month}")):
+            index_path = os.path.join(self.post_dir, rel_dir, '_index.md')
+            if os.path.exists(index_path):
+                continue
+            try:
+                # exclusive creation, in case another writer creates it first
+                with open(index_path, 'x', encoding='utf-8') as f:
+                    f.write(f"---\n")
+                    f.write(f'title: "{title}"\n')
+                    f.write(f"---\n")
+                print(f"Section index {index_path} created.")
+            except FileExistsError:
+                pass
+        return
+
+    def _prune_shard(self, subdir):
+        """
+        Remove a month shard (and its year) once its last post is removed.
+        """
+        year = subdir.split('/')[0]
+        for rel_dir in (subdir, year):
+            shard_dir = os.path.join(self.post_dir, rel_dir)
+            if os.listdir(shard_dir) != ['_index.md']:
+                return
+            shutil.rmtree(shard_dir)
+            print(f"Empty shard {shard_dir} removed.")
+        return
+
+    def migrate_to_sharded(self):
+        """
+        Move the posts of the flat layout into the YYYY/MM shards
+        and switch the handler to the sharded layout.
+        :return: The number of moved posts.
+        """
+        self.layout = "sharded"
+        moved = 0
+        for filepath in sorted(glob.glob(os.path.join(self.post_dir, '*.zh-Hant.md'))):
+            filename = os.path.basename(filepath)
+            subdir = self.shard_of(filename)
+            os.makedirs(os.path.join(self.post_dir, subdir), exist_ok=True)
+            self._ensure_shard_index(subdir)
+            new_filepath = os.path.join(self.post_dir, subdir, filename)
+            os.replace(filepath, new_filepath)
+            self._add_alias(new_filepath, self.flat_url(filename[:-len('.zh-Hant.md')]))
+            moved += 1
+        print(f"Moved {moved} posts to the sharded layout.")
+        return moved
+
+    def flat_url(self, filename_head):
+        """
+        Return the url of a post in the flat layout.
+        """
+        return f"{self.section_url}{filename_head}/"
+
+    def _add_alias(self, filepath, alias):
+        """
+        Add an alias to the front matter of a post file, after the draft line
+        (where render_post writes it).
+        """
+        text = self.read_post(filepath)
+        if not text.startswith("---\n"):
+            return
+        end = text.index("---\n", 4)
+        front_matter = text[4:end].splitlines(keepends=True)
+        if any(line.startswith("aliases:") for line in front_matter):
+            return
+        position = len(front_matter)
+        for index, line in enumerate(front_matter):
+            if line.startswith("draft:"):
+                position = index + 1
+        front_matter.insert(position, f'aliases: ["{alias}"]\n')
+        with open(filepath, 'w', encoding='utf-8', newline='') as f:
+            f.write("---\n" + "".join(front_matter) + text[end:])
+        return
+
+    def render_post(self, post):
+        """
+        Render the post to the Markdown text of its file.
+        """
+        text = f"---\n"
+        text += f'title: "{post.title}"\n'
+        text += f"date: {post.date}+08:00\n" # ensure it's GMT+8
+        text += f"draft: {str(post.draft).lower()}\n"
+        if post.subdir:
+            # keep the url of the flat layout working
+            text += f'aliases: ["{self.flat_url(post.filename_head)}"]\n'
+        if post.duplicate_of:
+            text += f'duplicate_of: "{post.duplicate_of}"\n'
+        #text += f"author: {post.author}\n"
+        #text += f'summary: "{post.summary}"\n'
+        text += f"---\n\n"
+        text += post.content
+        return text
+
+    def read_post(self, filepath):
+        """
+        Read the text of an existing post file.
+        """
+        with open(filepath, 'r', encoding='utf-8', newline='') as f:
+            return f.read()
 
     def write_post(self, post):
         """
         Write the post to a file.
         """
 
-        if not os.path.exists(self.post_dir):
-            os.makedirs(self.post_dir)
-            print(f"Created directory {self.post_dir}.")
+        post_dir = os.path.join(self.post_dir, post.subdir)
+        if not os.path.exists(post_dir):
+            os.makedirs(post_dir, exist_ok=True)
+            print(f"Created directory {post_dir}.")
+        if post.subdir:
+            self._ensure_shard_index(post.subdir)
 
-        filepath = os.path.join(self.post_dir, post.filename)
+        filepath = self.post_path(post)
         with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(f"---\n")
-            f.write(f'title: "{post.title}"\n')
-            f.write(f"date: {post.date}+08:00\n") # ensure it's GMT+8
-            f.write(f"draft: {str(post.draft).lower()}\n")
-            #f.write(f"author: {post.author}\n")
-            #f.write(f'summary: "{post.summary}"\n')
-            f.write(f"---\n\n")
-            f.write(post.content)
+            f.write(self.render_post(post))
         print(f"Post {post.filename} written successfully.")
         return
 
+    def remove_post(self, post):
+        """
+        Remove the file of a post. Return True if the file existed.
+        """
+        filepath = self.post_path(post)
+        if not os.path.exists(filepath):
+            return False
+        os.remove(filepath)
+        print(f"Post {post.filename} removed.")
+        if post.subdir:
+            self._prune_shard(post.subdir)
+        return True
+
     def prepare_a_post(self, row):
         """
         Save a post from a row in the data.
@@ -97,6 +590,7 @@ class HugoHandler(BaseHandler):
             content=base_post.content,
             filename_head=base_post.filename_head,
             filename=filename,
+            subdir=self.shard_of(base_post.filename_head),
             draft=base_post.draft
         )
         return post
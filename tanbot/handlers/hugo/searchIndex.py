@@ -0,0 +1,228 @@
+import os
+import re
+import json
+import gzip
+import zlib
+import unicodedata
+
+"""
+A prebuilt inverted index of the Hugo posts for client-side search.
+
+The index is written as static, gzip-compressed JSON files that the website
+fetches lazily:
+
+    manifest.json           the index parameters (number of shards, tokenizer)
+    shard-XX.json.gz        token -> sorted list of post ids
+    docs-XX.json.gz         post id -> {title, date, url}
+
+A token lives in shard `crc32(utf-8 token) % num_shards` and a post in docs
+shard `crc32(utf-8 post id) % num_shards`, so a query only downloads the
+shards of its own tokens and of the posts it shows. Latin text is split into lower-case
+words, Traditional Chinese (CJK) text into overlapping bigrams, and queries
+must be tokenized the same way.
+"""
+
+CJK_PATTERN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+def tokenize(text):
+    """
+    Split a text into search tokens: latin words of 2+ characters
+    and bigrams of CJK characters (a single CJK character is kept as is).
+    :return: The list of tokens, in order of appearance, with repetitions.
+    """
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKC', text).lower()
+    tokens = [w for w in WORD_PATTERN.findall(text) if len(w) > 1]
+    for run in CJK_PATTERN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+class SearchIndex:
+    def __init__(self, index_dir, num_shards=16):
+        """
+        :param index_dir: The directory of the static index files, e.g. static/tan/search.
+        :param num_shards: The number of token shards. Changing it requires a rebuild.
+        """
+        self.index_dir = index_dir
+        self.num_shards = num_shards
+        return
+
+    def shard_of(self, token):
+        return zlib.crc32(token.encode('utf-8')) % self.num_shards
+
+    def _shard_path(self, shard):
+        return os.path.join(self.index_dir, f"shard-{shard:02d}.json.gz")
+
+    def _docs_path(self, shard):
+        return os.path.join(self.index_dir, f"docs-{shard:02d}.json.gz")
+
+    def _manifest_path(self):
+        return os.path.join(self.index_dir, 'manifest.json')
+
+    def _read(self, path):
+        if not os.path.exists(path):
+            return {}
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write(self, path, data):
+        # mtime=0 and sorted keys keep the files byte-identical between runs,
+        # so unchanged shards do not show up in git
+        text = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(gzip.compress(text.encode('utf-8'), mtime=0))
+        os.replace(tmp_path, path)
+        return
+
+    def _read_manifest(self):
+        path = self._manifest_path()
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_manifest(self, count):
+        manifest = {
+            "version": 2,
+            "num_shards": self.num_shards,
+            "hash": "crc32",
+            "tokenizer": "latin-words+cjk-bigrams",
+            "docs": "docs-{:02d}.json.gz",
+            "shard": "shard-{:02d}.json.gz",
+            "count": count,
+        }
+        with open(self._manifest_path(), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        return
+
+    def exists(self):
+        """
+        Return True if an index of this version and number of shards was built.
+        """
+        manifest = self._read_manifest()
+        return (manifest is not None and manifest.get("version") == 2
+                and manifest.get("num_shards") == self.num_shards)
+
+    def load_docs(self):
+        """
+        Return the entries of all posts, merged from the docs shards.
+        """
+        docs = {}
+        for shard in range(self.num_shards):
+            docs.update(self._read(self._docs_path(shard)))
+        return docs
+
+    def lookup(self, token):
+        """
+        Return the ids of the posts containing a token.
+        """
+        return self._read(self._shard_path(self.shard_of(token))).get(token, [])
+
+    def build(self, posts):
+        """
+        Build the index from scratch, e.g. for the archive of an existing site.
+        The files of a previous index are replaced.
+        :param posts: HugoPost objects of all published posts.
+        """
+        os.makedirs(self.index_dir, exist_ok=True)
+        for filename in os.listdir(self.index_dir):
+            if filename.endswith('.json.gz') or filename == 'manifest.json':
+                os.remove(os.path.join(self.index_dir, filename))
+        self._write_manifest(0)
+        self.add_posts(posts)
+        print(f"Search index built with {len(posts)} posts.")
+        return
+
+    def add_posts(self, posts):
+        """
+        Merge posts into the index. Only the shards of their tokens and ids are rewritten.
+        :param posts: HugoPost objects; the post id is the filename_head.
+        """
+        if len(posts) == 0:
+            return
+        os.makedirs(self.index_dir, exist_ok=True)
+
+        # group the (token, id) pairs and the post entries by shard
+        updates = {}
+        doc_updates = {}
+        for post in posts:
+            doc_id = post.filename_head
+            url = f"{post.subdir}/{doc_id}/" if post.subdir else f"{doc_id}/"
+            doc_updates.setdefault(self.shard_of(doc_id), {})[doc_id] = {
+                "title": post.title, "date": post.date, "url": url}
+            for token in set(tokenize(post.title) + tokenize(post.content)):
+                updates.setdefault(self.shard_of(token), {}).setdefault(token, set()).add(doc_id)
+
+        for shard, tokens in updates.items():
+            path = self._shard_path(shard)
+            index = self._read(path)
+            for token, ids in tokens.items():
+                index[token] = sorted(ids.union(index.get(token, [])))
+            self._write(path, index)
+
+        added = 0
+        for shard, entries in doc_updates.items():
+            path = self._docs_path(shard)
+            docs = self._read(path)
+            added += len(entries.keys() - docs.keys())
+            docs.update(entries)
+            self._write(path, docs)
+
+        manifest = self._read_manifest() or {}
+        self._write_manifest(manifest.get("count", 0) + added)
+        print(f"Search index updated with {len(posts)} posts ({len(updates)} shards).")
+        return
+
+    def remove_posts(self, doc_ids):
+        """
+        Remove posts from the index. All token shards are scanned, as the tokens
+        of a removed post are not known anymore.
+        """
+        doc_ids = set(doc_ids)
+        if len(doc_ids) == 0 or not os.path.exists(self.index_dir):
+            return
+        for shard in range(self.num_shards):
+            path = self._shard_path(shard)
+            index = self._read(path)
+            changed = False
+            for token in list(index):
+                ids = [i for i in index[token] if i not in doc_ids]
+                if len(ids) != len(index[token]):
+                    changed = True
+                    if ids:
+                        index[token] = ids
+                    else:
+                        del index[token]
+            if changed:
+                self._write(path, index)
+
+        removed = 0
+        for shard in {self.shard_of(doc_id) for doc_id in doc_ids}:
+            path = self._docs_path(shard)
+            docs = self._read(path)
+            stale = doc_ids & docs.keys()
+            if stale:
+                for doc_id in stale:
+                    del docs[doc_id]
+                self._write(path, docs)
+                removed += len(stale)
+
+        manifest = self._read_manifest() or {}
+        self._write_manifest(max(manifest.get("count", 0) - removed, 0))
+        print(f"Search index: removed {len(doc_ids)} posts.")
+        return
+
+    def update(self, new_posts=(), updated_posts=(), removed_posts=()):
+        """
+        Apply the result of a HugoHandler run to the index.
+        """
+        stale = [p.filename_head for p in list(updated_posts) + list(removed_posts)]
+        self.remove_posts(stale)
+        self.add_posts(list(new_posts) + list(updated_posts))
+        return
@@ -50,7 +50,12 @@ class InstagramHandler(BaseImageHandler):
         )
         return instagram_post
 
-    def generate_posts(self, publish=False):
+    def select_posts(self):
+        """
+        Select the posts newer than the latest image in the image directory,
+        without writing anything.
+        :return: The lists of the posts to create and of the skipped posts.
+        """
         df = self.df
         all_posts = glob.glob(os.path.join(self.image_dir, "*.png"))
         last_post = None
@@ -63,15 +68,25 @@ class InstagramHandler(BaseImageHandler):
             last_datetime = '-'.join(last_datetime)
             last_datetime = time.strptime(last_datetime, self.filedate_format)
 
-        has_updated = False
+        create, skip = [], []
         for index, row in df.iterrows():
             post = self.prepare_a_post(row)
 
             if last_post is not None:
                 post_date = time.strptime(post.date, self.date_format)
                 if post_date <= last_datetime:
-                    print(f"Skipping post {post.filename} as it is older than the last post.")
+                    skip.append(post)
                     continue
+            create.append(post)
+        return create, skip
+
+    def generate_posts(self, publish=False):
+        create, skip = self.select_posts()
+        for post in skip:
+            print(f"Skipping post {post.filename} as it is older than the last post.")
+
+        has_updated = False
+        for post in create:
             self.write_image_post(post)
             if publish:
                 self.publish_a_post(post)
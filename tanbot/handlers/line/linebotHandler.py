@@ -33,6 +33,9 @@ class LinebotHandler(BaseImageHandler):
         """
         baseUrl= "https://asroc-taiwan.github.io/website/en/tan/tan-bot/"
         post_url = f"{baseUrl}{hugo_post.filename_head}/"
+        if hugo_post.subdir:
+            # the sharded layout adds the YYYY/MM sections to the url
+            post_url = f"{baseUrl}{hugo_post.subdir}/{hugo_post.filename_head}/"
         post = LinebotPost(
             title=hugo_post.title,
             content=hugo_post.content,
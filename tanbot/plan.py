@@ -0,0 +1,132 @@
+import os
+import json
+import math
+from dataclasses import dataclass, field, asdict
+from .handlers.line.linebotHandler import get_flex_message2
+
+"""
+The plan of a TANBot run: what a run would create, update, remove and
+broadcast on every channel, with the estimated bytes and API calls.
+
+A plan uses the same selection logic as the handlers, but it never writes
+a post, renders an image or calls a channel API.
+"""
+
+@dataclass
+class ChannelPlan:
+    channel: str
+    create: list = field(default_factory=list)       # the filenames of the posts to create
+    update: list = field(default_factory=list)       # the filenames of the posts to overwrite
+    remove: list = field(default_factory=list)       # the filenames of the posts to delete
+    skip: int = 0                                    # the number of posts that are up to date
+    duplicates: list = field(default_factory=list)   # the filenames of the near-duplicates
+    broadcasts: list = field(default_factory=list)   # the titles of the posts to broadcast
+    bytes: int = 0                                   # the estimated bytes written or sent
+    api_calls: int = 0                               # the estimated number of API calls
+
+    @property
+    def is_empty(self):
+        return not (self.create or self.update or self.remove or self.broadcasts)
+
+@dataclass
+class RunPlan:
+    source: str
+    rows: int
+    channels: dict = field(default_factory=dict)     # channel name -> ChannelPlan
+
+    @property
+    def is_empty(self):
+        return all(plan.is_empty for plan in self.channels.values())
+
+    def to_dict(self):
+        return asdict(self)
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+
+    def report(self):
+        """
+        Return a human readable summary of the plan.
+        """
+        lines = [f"Plan for {self.rows} rows from {self.source}:"]
+        for plan in self.channels.values():
+            lines.append(f"  {plan.channel}: {len(plan.create)} to create, {len(plan.update)} to update, "
+                         f"{len(plan.remove)} to remove, {plan.skip} to skip, "
+                         f"{len(plan.duplicates)} duplicates, {len(plan.broadcasts)} broadcasts, "
+                         f"~{plan.bytes} bytes, {plan.api_calls} API calls")
+            for filename in plan.create:
+                lines.append(f"    + {filename}")
+            for filename in plan.update:
+                lines.append(f"    ~ {filename}")
+            for filename in plan.remove:
+                lines.append(f"    - {filename}")
+        if self.is_empty:
+            lines.append("Nothing to do.")
+        return "\n".join(lines)
+
+def make_plan(bot, source, diff=None, line=True, facebook=False, instagram=False):
+    """
+    Compute the plan of a run of a bot with a loaded DataFrame.
+    :param bot: The TANBot.
+    :param source: A description of where the DataFrame was loaded from.
+    :param diff: Optional SnapshotDiff, as passed to HugoHandler.generate_posts.
+    :param line: Plan the LINE broadcasts.
+    :param facebook: Plan the Facebook page posts.
+    :param instagram: Plan the Instagram posts.
+    """
+    plan = RunPlan(source=source, rows=len(bot.df))
+
+    hugo = bot.hugo
+    selection = hugo.plan_posts(diff=diff)
+    written = selection.create + selection.update
+    if hugo.dedup is not None and hugo.dedup.policy == "mark":
+        written = written + selection.duplicates
+    plan.channels["hugo"] = ChannelPlan(
+        channel="hugo",
+        create=[p.filename for p in selection.create],
+        update=[p.filename for p in selection.update],
+        remove=[p.filename for p in selection.remove],
+        skip=len(selection.skip),
+        duplicates=[p.filename for p in selection.duplicates],
+        bytes=sum(len(hugo.render_post(p).encode('utf-8')) for p in written),
+    )
+
+    # only the new posts are broadcast, see TANBot.broadcast
+    new_posts = selection.create
+    if line:
+        messages = []
+        for post in new_posts:
+            line_post = bot.line.get_line_post_from_hugo_post(post)
+            messages.append(get_flex_message2(line_post.title, line_post.content, line_post.post_url))
+        plan.channels["line"] = ChannelPlan(
+            channel="line",
+            broadcasts=[p.title for p in new_posts],
+            bytes=sum(len(json.dumps(m).encode('utf-8')) for m in messages),
+            api_calls=len(messages),
+        )
+
+    if facebook:
+        # the rendered images are about the size of the base image
+        image_bytes = os.path.getsize(str(bot.facebook.base_image))
+        captions = [bot.facebook.get_facebook_post_from_hugo_post(p).caption for p in new_posts]
+        plan.channels["facebook"] = ChannelPlan(
+            channel="facebook",
+            create=[f"{p.filename_head}.png" for p in new_posts],
+            broadcasts=[p.title for p in new_posts],
+            bytes=sum(image_bytes + len(c.encode('utf-8')) for c in captions),
+            api_calls=math.ceil(len(new_posts) / bot.facebook.batch_size),
+        )
+
+    if instagram:
+        create, skip = bot.instagram.select_posts()
+        image_bytes = os.path.getsize(str(bot.instagram.base_image))
+        plan.channels["instagram"] = ChannelPlan(
+            channel="instagram",
+            create=[p.filename for p in create],
+            skip=len(skip),
+            broadcasts=[p.title for p in create],
+            bytes=len(create) * image_bytes,
+            # one login and one upload per post
+            api_calls=len(create) + 1 if create else 0,
+        )
+    return plan
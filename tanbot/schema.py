@@ -0,0 +1,107 @@
+import pandas as pd
+
+"""
+The declared layout of the TAN Google Sheet export.
+
+Only the columns listed in the schema are parsed; every other column in the
+export is dropped by the CSV reader itself (``usecols``) so it costs neither
+parse time nor memory. All text columns are read with an explicit string
+dtype, so pandas never runs a type inference pass over them, and the
+``Timestamp`` column is parsed with its known format.
+
+The optional ``pyarrow`` engine uses the multi-threaded Arrow CSV reader and
+Arrow-backed strings.
+"""
+
+class SheetSchemaError(ValueError):
+    """
+    Raised when the sheet data does not match the declared schema,
+    e.g. when a required column is missing from the export.
+    """
+    pass
+
+class SheetSchema:
+    def __init__(self, columns=None,
+                       timestamp_column="Timestamp",
+                       timestamp_format="%m/%d/%Y %H:%M:%S"):
+        """
+        :param columns: The list of columns the handlers use.
+                        All of them are required and read as strings,
+                        except the timestamp column which is parsed to datetime.
+        :param timestamp_column: The name of the timestamp column.
+        :param timestamp_format: The format of the timestamp in the sheet.
+        """
+        if columns is None:
+            columns = ['Timestamp', 'Subject', 'Sender', 'Snippet', 'Full Body', 'Message ID']
+        self.columns = list(columns)
+        self.timestamp_column = timestamp_column
+        self.timestamp_format = timestamp_format
+        return
+
+    @property
+    def text_columns(self):
+        """
+        Return the columns that are read as strings.
+        """
+        return [c for c in self.columns if c != self.timestamp_column]
+
+    def string_dtype(self, engine="c"):
+        """
+        Return the string dtype to use for the text columns.
+        """
+        if engine == "pyarrow":
+            return "string[pyarrow]"
+        return "string"
+
+    def read_csv(self, source, engine="c", **kwargs):
+        """
+        Read a CSV export (a path, url or file-like object) into a DataFrame
+        that follows the schema.
+        :param source: Anything accepted by pandas.read_csv.
+        :param engine: The CSV parser, "c" (default) or "pyarrow".
+        """
+        if engine not in ("c", "pyarrow"):
+            raise ValueError(f"Unsupported CSV engine: {engine}. Use 'c' or 'pyarrow'.")
+
+        # all columns are read as strings, the timestamp is parsed afterwards
+        # with its known format (much faster than the generic date inference)
+        dtype = {c: self.string_dtype(engine) for c in self.columns}
+
+        if engine == "pyarrow":
+            # the Arrow reader only accepts a list of column names
+            try:
+                df = pd.read_csv(source, engine="pyarrow", usecols=self.columns, dtype=dtype, **kwargs)
+            except KeyError as e:
+                raise SheetSchemaError(f"Sheet does not match the schema: {e}")
+        else:
+            wanted = set(self.columns)
+            df = pd.read_csv(source, engine="c", usecols=lambda c: c in wanted, dtype=dtype, **kwargs)
+        return self.coerce(df, engine=engine)
+
+    def validate(self, df):
+        """
+        Check that all the columns of the schema are present in the DataFrame.
+        """
+        missing = [c for c in self.columns if c not in df.columns]
+        if missing:
+            raise SheetSchemaError(f"Sheet is missing required columns: {missing}. "
+                                   f"Found columns: {list(df.columns)}")
+        return
+
+    def coerce(self, df, engine="c"):
+        """
+        Project and convert a DataFrame to the schema columns and dtypes.
+        """
+        self.validate(df)
+        df = df[self.columns].copy()
+        dtype = self.string_dtype(engine)
+        for c in self.text_columns:
+            df[c] = df[c].astype(dtype).fillna("")
+
+        ts = self.timestamp_column
+        if not pd.api.types.is_datetime64_any_dtype(df[ts]):
+            try:
+                df[ts] = pd.to_datetime(df[ts], format=self.timestamp_format)
+            except (ValueError, TypeError) as e:
+                raise SheetSchemaError(f"Column '{ts}' does not match the format '{self.timestamp_format}': {e}")
+        return df
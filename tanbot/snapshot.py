@@ -0,0 +1,136 @@
+import os
+import pandas as pd
+from dataclasses import dataclass, field
+
+"""
+A local snapshot of the last fetched sheet, stored in a columnar format
+(Parquet or Feather) together with a content hash of every row.
+
+Diffing a new fetch against the snapshot tells the handlers which rows were
+added, changed (e.g. a corrected subject or body) or removed since the last
+run, so the work of a run is proportional to the delta.
+
+Both formats are written with pyarrow.
+"""
+
+@dataclass
+class SnapshotDiff:
+    added: pd.DataFrame                 # rows that are new in this fetch
+    changed: pd.DataFrame               # rows whose content changed, as in this fetch
+    changed_from: pd.DataFrame          # the same rows, as in the previous snapshot
+    removed: pd.DataFrame               # rows that are no longer in the sheet, as in the previous snapshot
+    summary: dict = field(default_factory=dict)
+
+    @property
+    def is_empty(self):
+        return len(self.added) == 0 and len(self.changed) == 0 and len(self.removed) == 0
+
+class SnapshotStore:
+    def __init__(self, snapshot_dir, format="parquet", key="Message ID"):
+        """
+        :param snapshot_dir: The directory to store the snapshot.
+        :param format: The file format, "parquet" or "feather".
+        :param key: The column that identifies a row.
+        """
+        if format not in ("parquet", "feather"):
+            raise ValueError(f"Unsupported snapshot format: {format}. Use 'parquet' or 'feather'.")
+        self.snapshot_dir = snapshot_dir
+        self.format = format
+        self.key = key
+        self.hash_column = "_row_hash"
+        return
+
+    @property
+    def path(self):
+        return os.path.join(self.snapshot_dir, f"sheet.{self.format}")
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def row_hashes(self, df):
+        """
+        Return the content hash of every row, indexed by the key column.
+        """
+        columns = [c for c in df.columns if c != self.hash_column]
+        # hash the string representation so that the hash does not depend
+        # on the dtype backend (numpy or Arrow) used to read the sheet
+        hashes = pd.util.hash_pandas_object(df[columns].astype(str), index=False)
+        hashes.index = df[self.key].values
+        return hashes
+
+    def load(self):
+        """
+        Load the previous snapshot, or None if there is no snapshot yet.
+        """
+        if not self.exists():
+            return None
+        if self.format == "parquet":
+            df = pd.read_parquet(self.path)
+        else:
+            df = pd.read_feather(self.path)
+        return df
+
+    def save(self, df):
+        """
+        Save a fetched sheet as the new snapshot.
+        """
+        if not os.path.exists(self.snapshot_dir):
+            os.makedirs(self.snapshot_dir)
+            print(f"Created directory {self.snapshot_dir}.")
+
+        df = df.drop_duplicates(subset=self.key, keep="last").reset_index(drop=True)
+        df[self.hash_column] = self.row_hashes(df).values
+
+        # write to a temporary file first, so an interrupted run never
+        # leaves a truncated snapshot behind
+        tmp_path = f"{self.path}.tmp"
+        if self.format == "parquet":
+            df.to_parquet(tmp_path, index=False)
+        else:
+            df.to_feather(tmp_path)
+        os.replace(tmp_path, self.path)
+        print(f"Snapshot saved to {self.path}.")
+        return
+
+    def diff(self, df):
+        """
+        Compare a fetched sheet with the previous snapshot.
+        :param df: The newly fetched DataFrame.
+        :return: A SnapshotDiff. Without a previous snapshot, all rows are added.
+        """
+        df = df.drop_duplicates(subset=self.key, keep="last").reset_index(drop=True)
+        previous = self.load()
+        if previous is None:
+            previous = df.iloc[0:0].copy()
+            previous[self.hash_column] = pd.Series(dtype="uint64")
+
+        new_hashes = self.row_hashes(df)
+        old_hashes = pd.Series(previous[self.hash_column].values, index=previous[self.key].values)
+
+        new_keys = df[self.key]
+        old_keys = previous[self.key]
+        is_added = ~new_keys.isin(old_keys.values)
+        is_removed = ~old_keys.isin(new_keys.values)
+
+        common = new_keys[~is_added]
+        is_changed = pd.Series(False, index=df.index)
+        if len(common) > 0:
+            differs = new_hashes.loc[common.values].values != old_hashes.loc[common.values].values
+            is_changed.loc[common.index] = differs
+
+        changed = df[is_changed]
+        changed_from = previous.set_index(self.key).loc[changed[self.key].values].reset_index()
+        diff = SnapshotDiff(
+            added=df[is_added.values],
+            changed=changed,
+            changed_from=changed_from[[c for c in previous.columns if c != self.hash_column]],
+            removed=previous[is_removed.values].drop(columns=self.hash_column),
+        )
+        diff.summary = {
+            "added": len(diff.added),
+            "changed": len(diff.changed),
+            "removed": len(diff.removed),
+            "unchanged": len(df) - len(diff.added) - len(diff.changed),
+        }
+        print(f"Snapshot diff: {diff.summary}")
+        return diff
@@ -0,0 +1,205 @@
+import io
+import os
+import mmap
+import gzip
+import sqlite3
+from contextlib import closing
+import pandas as pd
+import requests
+from urllib.parse import quote
+from .schema import SheetSchemaError
+
+"""
+Data sources of the TAN sheet.
+
+All sources return a DataFrame that follows the SheetSchema, so the handlers
+do not know where the data came from. Besides the Google Sheet export, the
+pipeline can run offline on a local CSV, a SQLite table or a recorded export.
+
+A source can be selected with a spec string, either passed to TANBot(source=...)
+or set as DATA_SOURCE in the environment:
+
+    gsheet                      the Google Sheet export (default)
+    csv:<path>                  a local CSV file, read through a memory map
+    sqlite:<path>[#<table>]     a SQLite table (default table: tan)
+    replay:<path>               a recorded export (.csv or .csv.gz)
+"""
+
+class BaseSource:
+    name = "base"
+
+    def read(self, schema, engine="c"):
+        """
+        Read the sheet into a DataFrame that follows the schema.
+        :param schema: The SheetSchema.
+        :param engine: The CSV parser, "c" or "pyarrow".
+        """
+        raise NotImplementedError("Subclasses must implement read().")
+
+    def read_delta(self, schema, since, engine="c"):
+        """
+        Read only the rows with a timestamp at or after `since`.
+        Sources without server-side filtering do not implement it.
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} does not support delta reads.")
+
+    @property
+    def location(self):
+        """Where the rows are read from, in the syntax of the spec string."""
+        return ""
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.name}:{self.location})"
+
+class GoogleSheetSource(BaseSource):
+    name = "gsheet"
+
+    def __init__(self, sheet_id, worksheet_gid, base_url="https://docs.google.com",
+                 timestamp_column_id="A"):
+        """
+        :param sheet_id: The Google Sheet id.
+        :param worksheet_gid: The worksheet gid.
+        :param base_url: The Google Docs url, can be replaced by a local server in tests.
+        :param timestamp_column_id: The column letter of the Timestamp in the sheet,
+                                    used by the delta query.
+        """
+        if not sheet_id or not worksheet_gid:
+            raise ValueError("SHEET_ID and WORKSHEET_GID must be set in the environment variables.")
+        self.sheet_id = sheet_id
+        self.worksheet_gid = worksheet_gid
+        self.base_url = base_url.rstrip('/')
+        self.timestamp_column_id = timestamp_column_id
+
+    @property
+    def csv_url(self):
+        sheet_id = self.sheet_id
+        return f"{self.base_url}/spreadsheets/d/{sheet_id}/export?format=csv&id={sheet_id}&gid={self.worksheet_gid}"
+
+    @property
+    def location(self):
+        return f"{self.sheet_id}#gid={self.worksheet_gid}"
+
+    def read(self, schema, engine="c"):
+        return schema.read_csv(self.csv_url, engine=engine)
+
+    def delta_url(self, since):
+        """
+        Return the url of the visualization (gviz) query that selects
+        the rows with a timestamp at or after `since`. Rows stamped in the
+        same second as `since` are included, the caller de-duplicates them.
+        """
+        since = since.strftime('%Y-%m-%d %H:%M:%S')
+        query = f"select * where {self.timestamp_column_id} >= datetime '{since}'"
+        return (f"{self.base_url}/spreadsheets/d/{self.sheet_id}/gviz/tq"
+                f"?tqx=out:csv&gid={self.worksheet_gid}&tq={quote(query)}")
+
+    def read_delta(self, schema, since, engine="c"):
+        """
+        Read only the new rows with a server-side query,
+        so the transfer is proportional to the new rows.
+        """
+        res = requests.get(self.delta_url(since), timeout=60)
+        res.raise_for_status()
+        if not res.content.strip():
+            raise ValueError("Empty response from the delta query.")
+        return schema.read_csv(io.BytesIO(res.content), engine=engine)
+
+    def record(self, path):
+        """
+        Save the raw CSV export to a file, to be served later by a ReplaySource.
+        A path ending with .gz is gzip-compressed.
+        """
+        res = requests.get(self.csv_url, timeout=60)
+        res.raise_for_status()
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'wb') as f:
+            f.write(res.content)
+        print(f"Sheet export recorded to {path}.")
+        return path
+
+class LocalCSVSource(BaseSource):
+    name = "csv"
+
+    def __init__(self, path):
+        """
+        :param path: The path of a local CSV export.
+        """
+        self.path = path
+
+    @property
+    def location(self):
+        return self.path
+
+    def read(self, schema, engine="c"):
+        # map the file into memory instead of reading it through buffered I/O
+        with open(self.path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise SheetSchemaError(f"CSV file {self.path} is empty.")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return schema.read_csv(mm, engine=engine)
+
+class SQLiteSource(BaseSource):
+    name = "sqlite"
+
+    def __init__(self, path, table="tan"):
+        """
+        :param path: The path of the SQLite database.
+        :param table: The table holding the sheet rows, with the sheet column names.
+        """
+        self.path = path
+        self.table = table
+
+    @property
+    def location(self):
+        return f"{self.path}#{self.table}"
+
+    def read(self, schema, engine="c"):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"SQLite database {self.path} does not exist.")
+        with closing(sqlite3.connect(self.path)) as conn:
+            columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{self.table}")')]
+            if len(columns) == 0:
+                raise SheetSchemaError(f"Table {self.table} does not exist in {self.path}.")
+            schema.validate(pd.DataFrame(columns=columns))
+            # only select the schema columns
+            select = ', '.join(f'"{c}"' for c in schema.columns)
+            df = pd.read_sql_query(f'SELECT {select} FROM "{self.table}"', conn)
+        return schema.coerce(df, engine=engine)
+
+class ReplaySource(BaseSource):
+    name = "replay"
+
+    def __init__(self, path):
+        """
+        :param path: The path of an export recorded by GoogleSheetSource.record().
+        """
+        self.path = path
+
+    @property
+    def location(self):
+        return self.path
+
+    def read(self, schema, engine="c"):
+        opener = gzip.open if self.path.endswith('.gz') else open
+        with opener(self.path, 'rb') as f:
+            data = f.read()
+        return schema.read_csv(io.BytesIO(data), engine=engine)
+
+def make_source(spec, sheet_id=None, worksheet_gid=None):
+    """
+    Create a data source from a spec string, see the module docstring.
+    """
+    if spec is None or spec == "gsheet":
+        return GoogleSheetSource(sheet_id, worksheet_gid)
+
+    kind, _, location = spec.partition(':')
+    if not location:
+        raise ValueError(f"Data source '{spec}' needs a path, e.g. '{kind}:<path>'.")
+    if kind == "csv":
+        return LocalCSVSource(location)
+    if kind == "sqlite":
+        path, _, table = location.partition('#')
+        return SQLiteSource(path, table or "tan")
+    if kind == "replay":
+        return ReplaySource(location)
+    raise ValueError(f"Unknown data source: {spec}. Use gsheet, csv:, sqlite: or replay:.")
@@ -0,0 +1,36 @@
+import threading
+from http.server import HTTPServer
+import pandas as pd
+import pytest
+from tanbot.schema import SheetSchema
+
+@pytest.fixture
+def make_df():
+    """
+    Return a function that builds a coerced sheet DataFrame
+    from rows of raw cell values in the schema column order.
+    """
+    schema = SheetSchema()
+
+    def _make_df(rows):
+        return schema.coerce(pd.DataFrame(rows, columns=schema.columns))
+    return _make_df
+
+@pytest.fixture
+def serve():
+    """
+    Return a function that serves a request handler class on a local port
+    in a background thread and returns the base url. The servers are shut
+    down at the end of the test.
+    """
+    servers = []
+
+    def _serve(handler_class):
+        server = HTTPServer(("127.0.0.1", 0), handler_class)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}"
+    yield _serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
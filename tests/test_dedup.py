@@ -0,0 +1,34 @@
+from tanbot.dedup import DuplicateIndex, clean_resend_subject
+from tanbot.handlers.hugo.hugoHandler import HugoHandler
+
+BODY = ("The Taiwan Astronomy Network invites you to the summer colloquium on galaxy evolution "
+        "held at the Institute of Astronomy and Astrophysics. Registration is open until June 30. "
+        "歡迎大家踴躍參加本次天文學研討會，並請於六月三十日前完成報名。")
+
+def test_clean_resend_subject():
+    assert clean_resend_subject("Re: Fwd: [Reminder] Colloquium") == "Colloquium"
+    assert clean_resend_subject("提醒：天文研討會") == "天文研討會"
+
+def test_near_duplicates(tmp_path, make_df):
+    rows = [
+        ["06/04/2025 12:00:00", "[TAN] Summer colloquium", "a@asroc.org.tw", "", BODY, "abc123"],
+        ["06/05/2025 12:00:00", "[TAN] Job opening", "b@asroc.org.tw", "", "A postdoctoral position in radio astronomy is available.", "abc124"],
+        ["06/10/2025 12:00:00", "[TAN] Reminder: Summer colloquium", "a@asroc.org.tw", "", BODY + " Registration extended to July 5.", "abc125"],
+    ]
+    dedup_path = str(tmp_path / "dedup.json")
+    hugo = HugoHandler(str(tmp_path / "tan-bot"), dedup=DuplicateIndex(dedup_path))
+    hugo.df = make_df(rows)
+    hugo.generate_posts()
+    assert [p.filename_head for p in hugo.new_posts] == ["2025_06_04_12_00_00-abc123", "2025_06_05_12_00_00-abc124"]
+    assert [p.filename_head for p in hugo.duplicate_posts] == ["2025_06_10_12_00_00-abc125"]
+
+    # the index persists between runs, and "mark" writes the duplicate without broadcasting it
+    rows.append(["06/12/2025 12:00:00", "[TAN] Correction: Summer colloquium", "a@asroc.org.tw", "", BODY, "abc126"])
+    hugo = HugoHandler(str(tmp_path / "tan-bot"), dedup=DuplicateIndex(dedup_path, policy="mark"))
+    assert len(hugo.dedup) == 2
+    hugo.df = make_df(rows)
+    assert hugo.generate_posts()
+    assert hugo.new_posts == []
+    post = hugo.duplicate_posts[0]
+    assert post.duplicate_of == "2025_06_04_12_00_00-abc123"
+    assert 'duplicate_of: "2025_06_04_12_00_00-abc123"' in hugo.read_post(hugo.post_path(post))
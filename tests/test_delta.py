@@ -0,0 +1,70 @@
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import pytest
+from tanbot import TANBot
+from tanbot.sources import GoogleSheetSource
+
+HEADER = "Timestamp,Subject,Sender,Snippet,Full Body,Message ID\n"
+ROWS = [
+    "06/04/2025 12:00:00,[TAN] Colloquium,a@asroc.org.tw,,body,abc123\n",
+    "06/05/2025 13:30:00,[TAN] Workshop,b@asroc.org.tw,,body,abc124\n",
+]
+NEW_ROW = "6/6/2025 9:00:00,[TAN] Job opening,c@asroc.org.tw,,body,abc125\n"
+
+class StubSheetServer(BaseHTTPRequestHandler):
+    """
+    A local stand-in for the Google Sheet export and gviz query endpoints.
+    """
+    rows = []
+    queries = []
+    gviz_fails = False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.endswith("/export"):
+            self.reply(200, HEADER + "".join(self.rows))
+        elif url.path.endswith("/gviz/tq"):
+            self.queries.append(parse_qs(url.query)["tq"][0])
+            if self.gviz_fails:
+                self.reply(500, "error")
+            else:
+                self.reply(200, HEADER + NEW_ROW)
+        else:
+            self.reply(404, "")
+
+    def reply(self, status, text):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def sheet_url(serve):
+    StubSheetServer.queries = []
+    return serve(StubSheetServer)
+
+@pytest.mark.parametrize("gviz_fails", [False, True])
+def test_delta_fetch(tmp_path, sheet_url, gviz_fails):
+    source = GoogleSheetSource("sheet", "0", base_url=sheet_url)
+    StubSheetServer.rows = ROWS
+    StubSheetServer.gviz_fails = gviz_fails
+
+    # the first run has no history and loads the full export
+    bot = TANBot(path=str(tmp_path), source=source)
+    bot.load_gsheet(delta=True)
+    assert StubSheetServer.queries == []
+    bot.diff_gsheet()
+    bot.commit_snapshot()
+
+    # the next run only asks for the rows newer than the history
+    StubSheetServer.rows = ROWS + [NEW_ROW]
+    bot = TANBot(path=str(tmp_path), source=source)
+    bot.load_gsheet(delta=True)
+    assert StubSheetServer.queries == ["select * where A >= datetime '2025-06-05 13:30:00'"]
+    assert bot.df["Message ID"].tolist() == ["abc123", "abc124", "abc125"]
+    assert bot.diff_gsheet().summary["added"] == 1
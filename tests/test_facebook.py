@@ -0,0 +1,142 @@
+import json
+import time
+import requests
+import urllib3
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+import pytest
+from tanbot.handlers.facebook.facebookHandler import FacebookHandler
+from tanbot.handlers.hugo.hugoHandler import HugoPost
+
+class StubGraphServer(BaseHTTPRequestHandler):
+    """
+    A local stand-in for the Graph API batch endpoint.
+    The operations whose message starts with a title in `throttle_once` are
+    rejected by throttling the first time, those in `server_error` return a 500.
+    `throttle_batches` is the number of batch requests rejected as a whole by
+    throttling before the next one is executed. `delay` delays the response in seconds.
+    """
+    requests = []
+    throttle_once = set()
+    throttle_batches = 0
+    server_error = set()
+    delay = 0
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        raw = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + self.rfile.read(length)
+        form = {}
+        for part in BytesParser(policy=HTTP).parsebytes(raw).iter_parts():
+            form[part.get_param("name", header="content-disposition")] = part.get_payload(decode=True)
+        batch = json.loads(form["batch"])
+        self.requests.append(form)
+        time.sleep(self.delay)
+        if self.throttle_batches > 0:
+            StubGraphServer.throttle_batches -= 1
+            self.reply(400, {"error": {"message": "application request limit reached", "code": 4}})
+            return
+
+        responses = []
+        for op in batch:
+            title = parse_qs(op["body"])["message"][0].split("\n")[0]
+            attached = form[op["attached_files"]]
+            if title in self.throttle_once:
+                self.throttle_once.discard(title)
+                responses.append({"code": 400, "body": json.dumps({"error": {"message": "rate limit", "code": 613}})})
+            elif title in self.server_error:
+                responses.append({"code": 500, "body": json.dumps({"error": {"message": "unknown error", "code": 1}})})
+            elif not attached.startswith(b"\x89PNG"):
+                responses.append({"code": 400, "body": json.dumps({"error": {"message": "bad image", "code": 324}})})
+            else:
+                responses.append({"code": 200, "body": json.dumps({"id": str(len(self.requests)), "post_id": title})})
+        self.reply(200, responses)
+
+    def reply(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def graph_url(serve):
+    StubGraphServer.requests = []
+    StubGraphServer.throttle_once = set()
+    StubGraphServer.throttle_batches = 0
+    StubGraphServer.server_error = set()
+    StubGraphServer.delay = 0
+    return serve(StubGraphServer)
+
+def make_hugo_post(index):
+    return HugoPost(title=f"Post {index}", date="2025-06-04T12:00:00", author="a@asroc.org.tw",
+                    summary="", content="body", filename_head=f"2025_06_04_12_00_0{index}-abc12{index}",
+                    draft=False)
+
+def test_facebook_batch_publish(tmp_path, graph_url):
+    handler = FacebookHandler(str(tmp_path), page_id="123", access_token="token",
+                              graph_url=graph_url, batch_size=2, retry_delay=0)
+    posts = [make_hugo_post(i) for i in range(3)]
+    StubGraphServer.throttle_once = {"Post 1"}
+
+    results = handler.publish_hugo_posts(posts)
+    assert all("error" not in r for r in results.values())
+    assert len(results) == 3
+    # 2 batches of 2 and 1 operations, and 1 retry of the throttled operation
+    assert [len(json.loads(r["batch"])) for r in StubGraphServer.requests] == [2, 1, 1]
+    assert all(r["access_token"] == b"token" for r in StubGraphServer.requests)
+
+# a batch rejected as a whole by throttling was not executed and is sent again
+def test_facebook_batch_throttled(tmp_path, graph_url):
+    handler = FacebookHandler(str(tmp_path), page_id="123", access_token="token",
+                              graph_url=graph_url, retry_delay=0)
+    StubGraphServer.throttle_batches = 1
+    results = handler.publish_hugo_posts([make_hugo_post(0), make_hugo_post(1)])
+    assert all("error" not in r for r in results.values())
+    assert [len(json.loads(r["batch"])) for r in StubGraphServer.requests] == [2, 2]
+
+# operations that may have been published are never sent again
+def test_facebook_no_resend(tmp_path, graph_url):
+    handler = FacebookHandler(str(tmp_path), page_id="123", access_token="token",
+                              graph_url=graph_url, retry_delay=0, timeout=0.5)
+    posts = [make_hugo_post(i) for i in range(2)]
+    StubGraphServer.server_error = {"Post 0"}
+    results = handler.publish_hugo_posts(posts)
+    assert results["2025_06_04_12_00_00-abc120.png"]["status"] == 500
+    assert "error" not in results["2025_06_04_12_00_01-abc121.png"]
+    assert len(StubGraphServer.requests) == 1
+
+    # a read timeout is not resent either
+    StubGraphServer.requests = []
+    StubGraphServer.delay = 1
+    results = handler.publish_posts([handler.get_facebook_post_from_hugo_post(posts[1])])
+    assert "error" in results["2025_06_04_12_00_01-abc121.png"]
+    assert len(StubGraphServer.requests) == 1
+
+def test_facebook_never_sent(tmp_path):
+    # nothing listens on the port, the batch is retried and reported as failed
+    handler = FacebookHandler(str(tmp_path), page_id="123", access_token="token",
+                              graph_url="http://127.0.0.1:9", retry_delay=0, max_retries=1)
+    results = handler.publish_hugo_posts([make_hugo_post(0)])
+    assert "error" in results["2025_06_04_12_00_00-abc120.png"]
+    assert handler._never_sent(requests.ConnectionError(urllib3.exceptions.MaxRetryError(
+        None, "/", urllib3.exceptions.NewConnectionError(None, "refused"))))
+    assert not handler._never_sent(requests.ReadTimeout())
+
+def test_broadcast_checks_facebook_credentials(tmp_path, monkeypatch):
+    from tanbot import TANBot
+    monkeypatch.delenv("FB_PAGE_ID", raising=False)
+    monkeypatch.delenv("FB_PAGE_TOKEN", raising=False)
+    monkeypatch.chdir(tmp_path)  # no .env file
+    bot = TANBot(path=str(tmp_path))
+    bot.hugo.new_posts.append(make_hugo_post(0))
+    sent = []
+    monkeypatch.setattr(bot.line, "broadcast_a_hugo_post", sent.append)
+    with pytest.raises(ValueError, match="FB_PAGE_ID"):
+        bot.broadcast(line=True, facebook=True)
+    assert sent == []
@@ -0,0 +1,138 @@
+import os
+import pytest
+from tanbot.snapshot import SnapshotStore
+from tanbot.handlers.hugo.hugoHandler import HugoHandler
+from tanbot.handlers.line.linebotHandler import LinebotHandler
+
+ROWS = [
+    ["05/30/2025 08:00:00", "[TAN] Summer school", "a@asroc.org.tw", "", "body", "abc122"],
+    ["06/04/2025 12:00:00", "[TAN] Colloquium", "a@asroc.org.tw", "", "body", "abc123"],
+    ["06/05/2025 13:30:00", "[TAN] Workshop", "b@asroc.org.tw", "", "body", "abc124"],
+]
+
+# test the sharded layout
+def test_sharded_layout(tmp_path, make_df):
+    post_dir = str(tmp_path / "tan-bot")
+    hugo = HugoHandler(post_dir, layout="sharded")
+    hugo.df = make_df(ROWS[:2])
+    assert hugo.generate_posts()
+    assert os.path.exists(os.path.join(post_dir, "2025", "_index.md"))
+    assert os.path.exists(os.path.join(post_dir, "2025", "05", "_index.md"))
+    assert os.path.exists(os.path.join(post_dir, "2025", "06", "2025_06_04_12_00_00-abc123.zh-Hant.md"))
+
+    # the watermark is taken from the newest shard
+    hugo = HugoHandler(post_dir, layout="sharded")
+    hugo.df = make_df(ROWS)
+    assert hugo.latest_post_file().endswith("2025_06_04_12_00_00-abc123.zh-Hant.md")
+    assert hugo.generate_posts()
+    assert [p.filename_head for p in hugo.new_posts] == ["2025_06_05_13_30_00-abc124"]
+    assert hugo.new_posts[0].subdir == "2025/06"
+
+    # removing the last post of a shard removes the shard
+    hugo.remove_post(hugo.prepare_a_post(hugo.df.iloc[0]))
+    assert not os.path.exists(os.path.join(post_dir, "2025", "05"))
+
+# test the migration from the flat layout
+def test_migrate_to_sharded(tmp_path, make_df):
+    post_dir = str(tmp_path / "tan-bot")
+    hugo = HugoHandler(post_dir)
+    hugo.df = make_df(ROWS)
+    hugo.generate_posts()
+
+    # an unmigrated directory is not taken for an empty one
+    sharded = HugoHandler(post_dir, layout="sharded")
+    sharded.df = make_df(ROWS)
+    with pytest.raises(RuntimeError, match="migrate_to_sharded"):
+        sharded.generate_posts()
+    assert sharded.new_posts == []
+    assert not os.path.exists(os.path.join(post_dir, "2025"))
+
+    assert hugo.migrate_to_sharded() == 3
+    assert sorted(os.listdir(os.path.join(post_dir, "2025", "06"))) == [
+        "2025_06_04_12_00_00-abc123.zh-Hant.md",
+        "2025_06_05_13_30_00-abc124.zh-Hant.md",
+        "_index.md",
+    ]
+    assert [f for f in os.listdir(post_dir) if f.endswith(".zh-Hant.md")] == []
+
+    # the url sent before the migration is kept as an alias
+    post = hugo.prepare_a_post(hugo.df.iloc[1])
+    old_url = LinebotHandler(str(tmp_path)).get_line_post_from_hugo_post(
+        HugoHandler(post_dir).prepare_a_post(hugo.df.iloc[1])).post_url
+    text = hugo.read_post(hugo.post_path(post))
+    alias = "/tan/tan-bot/2025_06_04_12_00_00-abc123/"
+    assert f'aliases: ["{alias}"]' in text
+    assert old_url.endswith(alias)
+    # and a re-rendered post is identical to the migrated one
+    assert text == hugo.render_post(post)
+
+# test the parallel full rebuild
+def test_parallel_rebuild(tmp_path, make_df):
+    serial = HugoHandler(str(tmp_path / "serial"), layout="sharded")
+    serial.df = make_df(ROWS)
+    serial.generate_posts()
+
+    parallel = HugoHandler(str(tmp_path / "parallel"), layout="sharded")
+    parallel.df = make_df(ROWS)
+    # the rows are only prepared in the workers
+    prepared = []
+    prepare_a_post = parallel.prepare_a_post
+    parallel.prepare_a_post = lambda row: prepared.append(row) or prepare_a_post(row)
+    assert parallel.generate_posts(parallel=True, max_workers=2)
+    assert prepared == []
+    assert parallel.new_posts == serial.new_posts
+    assert parallel.rebuild_summary.written == 3
+    assert parallel.rebuild_summary.per_chunk == {"2025-05": 1, "2025-06": 2}
+    for post in serial.new_posts:
+        assert serial.read_post(serial.post_path(post)) == parallel.read_post(parallel.post_path(post))
+
+# test the search index
+def test_search_index(tmp_path, make_df):
+    from tanbot.handlers.hugo.searchIndex import tokenize
+    assert tokenize("[TAN] 天文研討會 Colloquium") == ["tan", "colloquium", "天文", "文研", "研討", "討會"]
+
+    index_dir = str(tmp_path / "search")
+    hugo = HugoHandler(str(tmp_path / "tan-bot"), search_index_dir=index_dir)
+    hugo.df = make_df(ROWS[:2] + [["06/05/2025 13:30:00", "[TAN] 天文研討會", "b@asroc.org.tw", "", "body", "abc124"]])
+    hugo.generate_posts()
+    index = hugo.search_index
+    assert index.lookup("研討") == ["2025_06_05_13_30_00-abc124"]
+    assert index.lookup("body") == sorted(p.filename_head for p in hugo.new_posts)
+    assert index.load_docs()["2025_06_04_12_00_00-abc123"]["title"] == "Colloquium"
+    assert index._read_manifest()["count"] == 3
+
+    # removed posts leave the index
+    index.remove_posts(["2025_06_05_13_30_00-abc124"])
+    assert index.lookup("研討") == []
+    assert len(index.load_docs()) == 2
+    assert index._read_manifest()["count"] == 2
+
+# test the archive of an existing site is indexed on the first run with an index
+def test_search_index_bootstrap(tmp_path, make_df):
+    post_dir = str(tmp_path / "tan-bot")
+    hugo = HugoHandler(post_dir)
+    hugo.df = make_df(ROWS[:2])
+    hugo.generate_posts()
+
+    hugo = HugoHandler(post_dir, search_index_dir=str(tmp_path / "search"))
+    hugo.df = make_df(ROWS)
+    assert hugo.generate_posts()
+    assert [p.filename_head for p in hugo.new_posts] == ["2025_06_05_13_30_00-abc124"]
+    assert hugo.search_index.lookup("body") == ["2025_05_30_08_00_00-abc122",
+                                                "2025_06_04_12_00_00-abc123",
+                                                "2025_06_05_13_30_00-abc124"]
+    assert hugo.search_index.load_docs()["2025_05_30_08_00_00-abc122"]["title"] == "Summer school"
+
+# test a corrected timestamp removes the old post from the search index
+def test_search_index_replaced(tmp_path, make_df):
+    store = SnapshotStore(str(tmp_path / "snapshot"))
+    hugo = HugoHandler(str(tmp_path / "tan-bot"), search_index_dir=str(tmp_path / "search"))
+    rows = [["06/04/2025 12:00:00", "[TAN] Colloquium", "a@asroc.org.tw", "", "galaxy evolution", "abc123"]]
+    df = make_df(rows)
+    hugo.generate_posts(diff=store.diff(df))
+    store.save(df)
+
+    rows[0][0] = "06/04/2025 12:30:00"
+    assert hugo.generate_posts(diff=store.diff(make_df(rows)))
+    assert hugo.search_index.lookup("galaxy") == ["2025_06_04_12_30_00-abc123"]
+    assert list(hugo.search_index.load_docs()) == ["2025_06_04_12_30_00-abc123"]
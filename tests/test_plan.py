@@ -0,0 +1,44 @@
+import os
+import json
+from tanbot import TANBot
+from tanbot.__main__ import main
+
+CSV = """Timestamp,Subject,Sender,Snippet,Full Body,Message ID
+06/04/2025 12:00:00,[TAN] Colloquium,a@asroc.org.tw,,body,abc123
+06/05/2025 13:30:00,[TAN] Workshop,b@asroc.org.tw,,body,abc124
+"""
+
+def list_files(path):
+    return sorted(os.path.join(root, f) for root, _, files in os.walk(path) for f in files)
+
+# test the plan mode has no side effects and matches the run
+def test_plan(tmp_path):
+    csv_path = tmp_path / "tan.csv"
+    csv_path.write_text(CSV, encoding="utf-8")
+    before = list_files(tmp_path)
+
+    bot = TANBot(path=str(tmp_path), source=f"csv:{csv_path}")
+    plan = bot.plan(facebook=True, instagram=True)
+    assert list_files(tmp_path) == before
+    assert plan.channels["hugo"].create == ["2025_06_04_12_00_00-abc123.zh-Hant.md",
+                                            "2025_06_05_13_30_00-abc124.zh-Hant.md"]
+    assert plan.channels["line"].api_calls == 2
+    assert plan.channels["facebook"].api_calls == 1
+    assert plan.channels["instagram"].api_calls == 3
+    assert plan.channels["hugo"].bytes > 0
+
+    bot.hugo.generate_posts()
+    assert [p.filename for p in bot.hugo.new_posts] == plan.channels["hugo"].create
+    assert bot.plan().is_empty
+
+def test_plan_cli(tmp_path, capsys):
+    csv_path = tmp_path / "tan.csv"
+    csv_path.write_text(CSV, encoding="utf-8")
+    assert main(["--path", str(tmp_path), "--source", f"csv:{csv_path}", "plan", "--json"]) == 0
+    captured = capsys.readouterr()
+    # stdout is only the plan, the progress messages go to stderr
+    plan = json.loads(captured.out)
+    assert "Data loaded successfully." in captured.err
+    assert plan["source"] == f"LocalCSVSource(csv:{csv_path})"
+    assert len(plan["channels"]["hugo"]["create"]) == 2
+    assert not os.path.exists(tmp_path / "content")
@@ -0,0 +1,33 @@
+import pytest
+import pandas as pd
+from tanbot.schema import SheetSchema, SheetSchemaError
+from tanbot.handlers.hugo.hugoHandler import HugoHandler
+
+CSV = """Timestamp,Subject,Sender,Snippet,Full Body,Message ID,Unused
+06/04/2025 12:00:00,[TAN] Colloquium,a@asroc.org.tw,snip,body -- footer,abc123,x
+06/05/2025 13:30:00,[TAN] 天文研討會,b@asroc.org.tw,,內容,abc124,y
+"""
+
+@pytest.mark.parametrize("engine", ["c", "pyarrow"])
+def test_schema_read_csv(tmp_path, engine):
+    """Test the column projection and dtypes of the sheet schema."""
+    path = tmp_path / "sheet.csv"
+    path.write_text(CSV, encoding="utf-8")
+    schema = SheetSchema()
+    df = schema.read_csv(str(path), engine=engine)
+    assert list(df.columns) == schema.columns
+    assert pd.api.types.is_datetime64_any_dtype(df["Timestamp"])
+    assert df["Snippet"].tolist() == ["snip", ""]
+
+    # the parsed rows still make posts
+    handler = HugoHandler(str(tmp_path / "posts"))
+    post = handler.prepare_a_post(df.iloc[1])
+    assert post.filename == "2025_06_05_13_30_00-abc124.zh-Hant.md"
+    assert post.date == "2025-06-05T13:30:00"
+
+def test_schema_missing_columns(tmp_path):
+    """Test that a schema drift raises a SheetSchemaError."""
+    path = tmp_path / "sheet.csv"
+    path.write_text(CSV.replace("Full Body", "Body"), encoding="utf-8")
+    with pytest.raises(SheetSchemaError, match="Full Body"):
+        SheetSchema().read_csv(str(path))
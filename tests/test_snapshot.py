@@ -0,0 +1,61 @@
+import os
+import pytest
+from tanbot.snapshot import SnapshotStore
+from tanbot.handlers.hugo.hugoHandler import HugoHandler
+
+ROWS = [
+    ["06/04/2025 12:00:00", "[TAN] Colloquium", "a@asroc.org.tw", "", "body", "abc123"],
+    ["06/05/2025 13:30:00", "[TAN] Workshop", "b@asroc.org.tw", "", "body", "abc124"],
+]
+
+@pytest.mark.parametrize("format", ["parquet", "feather"])
+def test_snapshot_diff(tmp_path, format, make_df):
+    """Test the added, changed and removed rows against the previous snapshot."""
+    store = SnapshotStore(str(tmp_path / "snapshot"), format=format)
+    df = make_df(ROWS)
+    diff = store.diff(df)
+    assert diff.summary == {"added": 2, "changed": 0, "removed": 0, "unchanged": 0}
+    store.save(df)
+    assert store.diff(df).is_empty
+
+    new_rows = [
+        ["06/05/2025 13:30:00", "[TAN] Workshop (updated)", "b@asroc.org.tw", "", "body", "abc124"],
+        ["06/06/2025 09:00:00", "[TAN] Job opening", "c@asroc.org.tw", "", "body", "abc125"],
+    ]
+    diff = store.diff(make_df(new_rows))
+    assert diff.added["Message ID"].tolist() == ["abc125"]
+    assert diff.changed["Message ID"].tolist() == ["abc124"]
+    assert diff.changed_from["Subject"].tolist() == ["[TAN] Workshop"]
+    assert diff.removed["Message ID"].tolist() == ["abc123"]
+
+def test_hugo_apply_diff(tmp_path, make_df):
+    """Test that HugoHandler regenerates only the rows in the diff."""
+    store = SnapshotStore(str(tmp_path / "snapshot"))
+    post_dir = str(tmp_path / "posts")
+    hugo = HugoHandler(post_dir)
+    df = make_df(ROWS)
+    assert hugo.generate_posts(diff=store.diff(df))
+    store.save(df)
+    assert len(hugo.new_posts) == 2
+
+    new_rows = [ROWS[0][:1] + ["[TAN] Colloquium (room changed)"] + ROWS[0][2:]]
+    hugo = HugoHandler(post_dir)
+    assert hugo.generate_posts(diff=store.diff(make_df(new_rows)))
+    assert hugo.new_posts == []
+    assert [p.title for p in hugo.updated_posts] == ["Colloquium (room changed)"]
+    assert [p.filename_head for p in hugo.removed_posts] == ["2025_06_05_13_30_00-abc124"]
+    assert sorted(os.listdir(post_dir)) == ["2025_06_04_12_00_00-abc123.zh-Hant.md"]
+
+def test_commit_snapshot(tmp_path, make_df):
+    """Test that the snapshot only advances with commit_snapshot()."""
+    from tanbot import TANBot
+    csv_path = tmp_path / "tan.csv"
+    make_df(ROWS).assign(Timestamp=[r[0] for r in ROWS]).to_csv(csv_path, index=False)
+    bot = TANBot(path=str(tmp_path), source=f"csv:{csv_path}")
+    bot.load_gsheet()
+    assert bot.diff_gsheet().summary["added"] == 2
+    assert not bot.snapshot.exists()
+    # a failed run shows the same diff again
+    assert bot.diff_gsheet().summary["added"] == 2
+    bot.commit_snapshot()
+    assert bot.diff_gsheet().is_empty
@@ -0,0 +1,52 @@
+import gzip
+import sqlite3
+import pytest
+import pandas as pd
+from tanbot import TANBot
+from tanbot.schema import SheetSchemaError
+from tanbot.sources import LocalCSVSource, SQLiteSource, ReplaySource, make_source
+
+CSV = """Timestamp,Subject,Sender,Snippet,Full Body,Message ID,Unused
+06/04/2025 12:00:00,[TAN] Colloquium,a@asroc.org.tw,snip,body -- footer,abc123,x
+06/05/2025 13:30:00,[TAN] 天文研討會,b@asroc.org.tw,,內容,abc124,y
+"""
+
+def test_make_source():
+    assert isinstance(make_source("csv:/tmp/tan.csv"), LocalCSVSource)
+    source = make_source("sqlite:/tmp/tan.db#emails")
+    assert isinstance(source, SQLiteSource) and source.table == "emails"
+    source = make_source("replay:/tmp/tan.csv.gz")
+    assert isinstance(source, ReplaySource) and source.path == "/tmp/tan.csv.gz"
+    with pytest.raises(ValueError):
+        make_source("ftp:/tmp/tan.csv")
+    with pytest.raises(ValueError):
+        make_source("gsheet")  # no SHEET_ID
+
+# test the offline sources give the same DataFrame
+def test_offline_sources(tmp_path):
+    csv_path = tmp_path / "tan.csv"
+    csv_path.write_text(CSV, encoding="utf-8")
+
+    replay_path = tmp_path / "tan.csv.gz"
+    with gzip.open(replay_path, "wb") as f:
+        f.write(CSV.encode("utf-8"))
+
+    db_path = tmp_path / "tan.db"
+    with sqlite3.connect(db_path) as conn:
+        pd.read_csv(csv_path, dtype=str).to_sql("tan", conn, index=False)
+
+    frames = []
+    for spec in [f"csv:{csv_path}", f"replay:{replay_path}", f"sqlite:{db_path}"]:
+        bot = TANBot(path=str(tmp_path), source=spec)
+        bot.load_gsheet()
+        frames.append(bot.hugo.df)
+    for df in frames[1:]:
+        pd.testing.assert_frame_equal(frames[0], df)
+    assert frames[0]["Subject"].tolist() == ["[TAN] Colloquium", "[TAN] 天文研討會"]
+
+def test_sqlite_missing_column(tmp_path):
+    db_path = tmp_path / "tan.db"
+    with sqlite3.connect(db_path) as conn:
+        pd.DataFrame({"Timestamp": ["06/04/2025 12:00:00"]}).to_sql("tan", conn, index=False)
+    with pytest.raises(SheetSchemaError):
+        TANBot(path=str(tmp_path), source=f"sqlite:{db_path}").load_gsheet()